@@ -11,21 +11,390 @@ Created on Sun Feb 14 14:45:09 2021
 The code includes some lines of Eszter Simon.
 """
 
+import hashlib
 import json
 import re
+import shlex
+import shutil
 import subprocess
-import pdc
-import elonorm
-import epitran
+import threading
+import time
+from array import array
+from itertools import islice
+try:
+    from re import _parser as sre_parse # Python 3.11 and later.
+except ImportError:
+    import sre_parse
+from collections import OrderedDict
+from contextlib import contextmanager
 import os
+import queue
+# pdc and elonorm, and the modules only some functions need (like sqlite3
+# and multiprocessing), are imported when they are first needed,
+# so that the corpus functions work without them (and start faster).
 
-unanalyzed = set()
-unanalyzed_freq = dict()
-unanalyzed_pos = list()
-elonorm_hibak = dict()
+class Statistics:
+    """ Mergeable statistics of a part, a poem or a corpus: the numbers of
+    stanzas, lines and words, the long and stressed syllable counts by
+    position for each line length, and the wordstat (the frequent lemmas,
+    the vocabulary and the repetitivity, the last two averaged over the
+    merged parts or poems). The wordstat of a part only keeps its frequent
+    lemmas, so the exact number of occurrences of every content lemma
+    (see content_lemma()) is counted apart, in lemma_frequencies
+    (by WordstatAnalyzer during the analysis, see from_json()).
+    merge() is associative, so the statistics of parts, poems
+    and parallel workers can be combined in any grouping. """
 
-rep = pdc.PDC(dbhost="***", dbuser="***",
+    def __init__(self):
+        self.stanzas = 0
+        self.lines = 0
+        self.words = 0
+        self.long = dict() # Line length: long syllables by position.
+        self.stressed = dict() # Line length: stressed syllables by position.
+        self.lemmas = dict() # The frequent lemmas of the wordstat of the units.
+        self.lemma_frequencies = dict() # Every content lemma of the units.
+        self.vocabulary = 0 # Sum of the vocabularies of the units (a Fraction, exact, so that merging is associative).
+        self.repetitivity = 0 # Sum of the repetitivities of the units.
+        self.units = 0 # Number of units with a wordstat.
+
+    @classmethod
+    def from_json(cls, text, lemma_frequencies=None):
+        """ Reads the statistics stored in a JSON-compatible poem (or part) by the analyzers.
+        The exact lemma frequencies are not stored in the JSON: they are
+        the given ones (see WordstatAnalyzer.take_frequencies()), or else
+        they are counted from the words of the poem. """
+        statistics = cls()
+        statistics.stanzas = text.get("number_of_stanzas", 0)
+        statistics.lines = text.get("number_of_lines", 0)
+        statistics.words = text.get("number_of_words", 0)
+        for key, histogram in [["long_syllable_statistics", statistics.long], ["stressed_syllable_statistics", statistics.stressed]]:
+            if(key in text):
+                for length in text[key]:
+                    histogram[int(length)] = list(text[key][length])
+        if("wordstat" in text):
+            from fractions import Fraction
+            wordstat = text["wordstat"]
+            statistics.vocabulary = Fraction(wordstat["_vocabulary"])
+            statistics.repetitivity = Fraction(wordstat["_repetitivity"])
+            statistics.units = 1
+            statistics.lemmas = { lemma: wordstat[lemma] for lemma in wordstat if lemma not in ["_vocabulary", "_repetitivity"] }
+            if(lemma_frequencies is not None):
+                statistics.lemma_frequencies = dict(lemma_frequencies)
+                return statistics
+            frequencies = statistics.lemma_frequencies
+            for unit in poem_units(text):
+                for stanza in unit.get("stanzas", []):
+                    for line in stanza.get("lines", []):
+                        for word in line.get("words", []):
+                            lemma = content_lemma(word)
+                            if(lemma is not None):
+                                frequencies[lemma] = frequencies.get(lemma, 0) + 1
+        return statistics
+
+    def merge(self, other):
+        """ Adds other statistics to these. """
+        self.stanzas += other.stanzas
+        self.lines += other.lines
+        self.words += other.words
+        for histogram, others in [[self.long, other.long], [self.stressed, other.stressed]]:
+            for length in others:
+                if(length not in histogram):
+                    histogram[length] = [0] * len(others[length])
+                counts = histogram[length]
+                for a in range(len(others[length])):
+                    counts[a] += others[length][a]
+        for lemma in other.lemmas:
+            self.lemmas[lemma] = self.lemmas.get(lemma, 0) + other.lemmas[lemma]
+        for lemma in other.lemma_frequencies:
+            self.lemma_frequencies[lemma] = self.lemma_frequencies.get(lemma, 0) + other.lemma_frequencies[lemma]
+        self.vocabulary += other.vocabulary
+        self.repetitivity += other.repetitivity
+        self.units += other.units
+        return self
+
+    def to_json(self, text):
+        """ Stores the statistics in a JSON-compatible poem (or any dictionary),
+        under the keys of the analyzers. """
+        if(self.stanzas>0):
+            text["number_of_stanzas"] = self.stanzas
+        if(self.lines>0):
+            text["number_of_lines"] = self.lines
+        if(self.words>0):
+            text["number_of_words"] = self.words
+        if(len(self.long)>0):
+            text["long_syllable_statistics"] = { length: list(self.long[length]) for length in self.long }
+        if(len(self.stressed)>0):
+            text["stressed_syllable_statistics"] = { length: list(self.stressed[length]) for length in self.stressed }
+        if(self.units>0):
+            text["wordstat"] = { "_vocabulary": float(self.vocabulary / self.units), "_repetitivity": float(self.repetitivity / self.units) }
+            text["wordstat"].update(self.lemmas)
+        return text
+
+
+class RunMetrics:
+    """ Timers and counters of one analysis run: the wall time of the stages,
+    of every analyzer and of the external tool calls, the number of processes
+    started, the cache hits and the words analyzed.
+    The timers are named like "analyzer.SyllableAnalyzer" or "tool.hfst-lookup",
+    and hold the seconds spent and the number of calls.
+    In quiet mode the progress messages of the run (see say()) are not printed. """
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.timers = dict() # Name: [seconds, calls].
+        self.counters = dict()
+
+    def add_time(self, name, seconds, calls=1):
+        if(name not in self.timers):
+            self.timers[name] = [0.0, 0]
+        timer = self.timers[name]
+        timer[0] += seconds
+        timer[1] += calls
+
+    @contextmanager
+    def timed(self, name):
+        """ Adds the time spent in a with block to a timer. """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def say(self, text, end='\n'):
+        """ Prints a progress message, unless in quiet mode. """
+        if(not self.quiet):
+            print(text, end=end)
+
+    def merge(self, other):
+        """ Adds the timers and counters of another run (or worker) to these. """
+        for name in other.timers:
+            self.add_time(name, other.timers[name][0], other.timers[name][1])
+        for name in other.counters:
+            self.count(name, other.counters[name])
+        return self
+
+    def report(self):
+        """ Returns the timers, the counters and the rates derived from them:
+        the words per second of the run and the hit rate of each cache. """
+        rates = dict()
+        if("run" in self.timers and self.timers["run"][0] > 0):
+            rates["words_per_second"] = self.counters.get("words", 0) / self.timers["run"][0]
+        for name in self.counters:
+            if(name.endswith(".misses")):
+                cache = name[:-len(".misses")]
+                hits = sum([self.counters[counter] for counter in self.counters
+                            if counter.startswith(cache + '.') and counter.endswith("hits")])
+                if(hits + self.counters[name] > 0):
+                    rates[cache + ".hit_rate"] = hits / (hits + self.counters[name])
+        return { "timers": { name: { "seconds": self.timers[name][0], "calls": self.timers[name][1] } for name in self.timers },
+                "counters": dict(self.counters),
+                "rates": rates }
+
+    def write(self, location):
+        """ Writes the report of the run into a JSON file,
+        or into a CSV file (kind, name, value, calls) if its name ends in .csv. """
+        report = self.report()
+        file = open(location, "w", newline='')
+        if(location.endswith(".csv")):
+            import csv
+            writer = csv.writer(file)
+            writer.writerow(["kind", "name", "value", "calls"])
+            for name in report["timers"]:
+                writer.writerow(["timer", name, report["timers"][name]["seconds"], report["timers"][name]["calls"]])
+            for name in report["counters"]:
+                writer.writerow(["counter", name, report["counters"][name], ''])
+            for name in report["rates"]:
+                writer.writerow(["rate", name, report["rates"][name], ''])
+        else:
+            file.write(json.dumps(report, indent=2))
+        file.close()
+
+
+class Diagnostics:
+    """ Append-only log of the diagnostics of analysis runs: the PurePos
+    errors, the forms hfst could not analyze (with their frequencies) and
+    the normalizations of the words that had to be guessed anyway.
+    The records are kept in memory and appended to a JSON lines file in
+    batches, each batch with a single write in append mode, so the parallel
+    workers of a run (which get a copy of the object, see analyze_parallel())
+    can share the file. An error is only logged once by a process; the
+    frequencies are logged as increments. Every record names its run, and
+    summary() adds up the records of a run (or of all of them). """
+
+    def __init__(self, location="diagnostics.jsonl", run=None, batch=1000):
+        self.location = os.path.abspath(location)
+        if(run is None):
+            run = time.strftime("%Y%m%d%H%M%S") + '-' + str(os.getpid()) + '-' + os.urandom(3).hex()
+        self.run = run
+        self.batch = batch
+        self.logged = set() # The errors logged by this process.
+        self.errors = [] # The records kept in memory:
+        self.forms = dict() # unanalyzed form: count,
+        self.words = dict() # guessed word: [normalized form, count].
+        self.pending = 0
+
+    def added(self):
+        self.pending += 1
+        if(self.pending >= self.batch):
+            self.flush()
+
+    def error(self, error):
+        if(error not in self.logged):
+            self.logged.add(error)
+            self.errors.append(error)
+            self.added()
+
+    def unanalyzed(self, form):
+        self.forms[form] = self.forms.get(form, 0) + 1
+        self.added()
+
+    def normalization(self, word, normalized):
+        if(word not in self.words):
+            self.words[word] = [normalized, 0]
+        self.words[word][1] += 1
+        self.added()
+
+    def flush(self):
+        """ Appends the records kept in memory to the file. """
+        if(self.pending == 0):
+            return
+        records = [{ "run": self.run, "error": error } for error in self.errors]
+        records += [{ "run": self.run, "unanalyzed": form, "count": self.forms[form] } for form in self.forms]
+        records += [{ "run": self.run, "word": word, "normalized": self.words[word][0], "count": self.words[word][1] } for word in self.words]
+        data = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8')
+        file = os.open(self.location, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            while(len(data) > 0):
+                data = data[os.write(file, data):]
+        finally:
+            os.close(file)
+        self.errors = []
+        self.forms = dict()
+        self.words = dict()
+        self.pending = 0
+
+    def summary(self, run=None):
+        """ Adds up the logged records of a run (of all runs if run is None).
+        Returns the sorted errors, the frequencies of the unanalyzed forms,
+        and the normalized form and frequency of the guessed words. """
+        errors = set()
+        unanalyzed = dict()
+        normalizations = dict()
+        if(os.path.exists(self.location)):
+            for line in open(self.location, "r", encoding='utf-8'):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # A line torn by a crash.
+                if(run is not None and record.get("run") != run):
+                    continue
+                if("error" in record):
+                    errors.add(record["error"])
+                elif("unanalyzed" in record):
+                    unanalyzed[record["unanalyzed"]] = unanalyzed.get(record["unanalyzed"], 0) + record["count"]
+                elif("word" in record):
+                    if(record["word"] not in normalizations):
+                        normalizations[record["word"]] = [record["normalized"], 0]
+                    normalizations[record["word"]][1] += record["count"]
+        return { "errors": sorted(errors), "unanalyzed": unanalyzed, "normalizations": normalizations }
+
+    def export(self, directory='.', run=None):
+        """ Writes the summary of a run (of this one by default) into the
+        errors.csv, unanalyzed.csv and normalizations.csv files of a directory,
+        the forms and words by decreasing frequency. """
+        self.flush()
+        if(run is None):
+            run = self.run
+        summary = self.summary(run)
+        file = open(os.path.join(directory, "errors.csv"), "w")
+        for error in summary["errors"]:
+            file.write(error + '\n')
+        file.close()
+        file = open(os.path.join(directory, "unanalyzed.csv"), "w")
+        for form in sorted(summary["unanalyzed"], key=lambda form: -summary["unanalyzed"][form]):
+            file.write(form + '\t' + str(summary["unanalyzed"][form]) + '\n')
+        file.close()
+        file = open(os.path.join(directory, "normalizations.csv"), "w")
+        normalizations = summary["normalizations"]
+        for word in sorted(normalizations, key=lambda word: -normalizations[word][1]):
+            file.write(word + '\t' + normalizations[word][0] + '\t' + str(normalizations[word][1]) + '\n')
+        file.close()
+        return summary
+
+
+class AnalysisContext:
+    """ The state of one analysis run: the words hfst could not analyze,
+    the suspicious normalizations, the PurePos errors, the metrics,
+    the diagnostics log of the run (see Diagnostics) and the directory
+    of the temporary files. Parallel workers get a context each,
+    which are merged in corpus order at the end of the run. """
+
+    def __init__(self, workdir='.'):
+        self.workdir = workdir
+        self.unanalyzed = set()
+        self.unanalyzed_freq = dict()
+        self.unanalyzed_pos = list() # Positions of the unanalyzed words in the last convert() call.
+        self.elonorm_hibak = dict()
+        self.errors = set()
+        self.statistics = Statistics() # Of the poems analyzed in the run.
+        self.metrics = RunMetrics()
+        self.diagnostics = None # Set during analyze_corpus().
+
+    def path(self, name):
+        """ Returns the location of a temporary file of the run. """
+        return os.path.join(self.workdir, name)
+
+    def merge(self, other):
+        """ Adds the statistics of another context to this one. """
+        self.unanalyzed.update(other.unanalyzed)
+        for ua in other.unanalyzed_freq:
+            if(ua in self.unanalyzed_freq):
+                self.unanalyzed_freq[ua] += other.unanalyzed_freq[ua]
+            else:
+                self.unanalyzed_freq[ua] = other.unanalyzed_freq[ua]
+        for word in other.elonorm_hibak:
+            if(word not in self.elonorm_hibak):
+                self.elonorm_hibak[word] = list(other.elonorm_hibak[word])
+            else:
+                self.elonorm_hibak[word][1] += other.elonorm_hibak[word][1]
+        self.errors.update(other.errors)
+        self.statistics.merge(other.statistics)
+        self.metrics.merge(other.metrics)
+
+
+default_context = AnalysisContext() # Used when no context is given.
+unanalyzed = default_context.unanalyzed
+unanalyzed_freq = default_context.unanalyzed_freq
+unanalyzed_pos = default_context.unanalyzed_pos
+elonorm_hibak = default_context.elonorm_hibak
+
+current_repository = None # The PDC repository, connected on first use (see pdc_repository()).
+
+def pdc_repository():
+    """ Returns the PDC repository, connecting to it on the first call. """
+    global current_repository
+    if(current_repository is None):
+        import pdc
+        current_repository = pdc.PDC(dbhost="***", dbuser="***",
                            dbpassword="***", dbname="***", selected=['RPHA'], verb=True)
+    return current_repository
+
+
+def set_pdc_repository(repository):
+    """ Makes the functions use another repository (or a stand-in of it) instead of connecting to PDC. """
+    global current_repository
+    current_repository = repository
+
+
+def __getattr__(name):
+    """ anac.rep is still the PDC repository, connected when it is first used. """
+    if(name == 'rep'):
+        return pdc_repository()
+    raise AttributeError("module 'anac' has no attribute '" + name + "'")
+
 
 def poemjson(text, poemid="", author="", title=""):
     """ Handles the JSON -compatible conversion of plain text poems
@@ -39,7 +408,7 @@ def poemjson(text, poemid="", author="", title=""):
                 "poem_author": author,
                 "stanzas": json_stanzas }
     else:
-        parts = re.split('\n*(\[part)[ ]?["]?([^\]]*)["]?\]\n*', text)
+        parts = part_pattern.split(text)
         json_parts = []
         a = 0
         partnr = 0
@@ -67,11 +436,20 @@ def poemjson(text, poemid="", author="", title=""):
 
 def spacetounderscore(text):
     """ A quick'n'dirty solution for my embarassing RegEx problem. """
-    return re.sub(r' ', r'_', text.group())
+    return text.group().replace(' ', '_')
+
+
+part_pattern = re.compile(r'\n*(\[part)[ ]?["]?([^\]]*)["]?\]\n*') # A part title, the groups are '[part' and the title.
+bracket_pattern = re.compile(r'\[[^\]]*\]') # An editorial note in brackets.
+word_characters = 'A-zÖÜÓŐÚÉÁŰÍöüóőúéáűí' # Anything else around a word is punctuation.
+word_pattern = re.compile('[' + word_characters + '](?:[^ ]*[' + word_characters + '])?') # A word without the punctuation around it.
+missing_end_pattern = re.compile('[_ ]lines')
+missing_start_pattern = re.compile('miss[_ ]\"')
 
 def poemtextjson(text):
     """ Handles the JSON-compatible conversion of plain text. """
-    text = re.sub(r'\[[^\]]*\]', spacetounderscore, text)
+    if('[' in text):
+        text = bracket_pattern.sub(spacetounderscore, text)
     stanzas = text.split('\n\n')
     json_stanzas = []
     stanzanr = 0
@@ -84,22 +462,18 @@ def poemtextjson(text):
             if('[miss' not in line):
                 linenr += 1
                 json_words = []
-                words = line.split(' ')
                 wordnr = 0
-                for word in words:
-                    word = re.sub(r'^[^A-zÖÜÓŐÚÉÁŰÍöüóőúéáűí]+', r'', word)
-                    word = re.sub(r'[^A-zÖÜÓŐÚÉÁŰÍöüóőúéáűí]+$', r'', word) # Remove punctuation.
-                    if(len(word)>0):
-                        wordnr += 1
-                        json_words.append({ "word_number": wordnr,
-                         "word_text": word })
+                for word in word_pattern.findall(line): # The words between the spaces, without punctuation.
+                    wordnr += 1
+                    json_words.append({ "word_number": wordnr,
+                     "word_text": word })
                 if(len(json_words)>0):
                     json_lines.append({ "line_number": linenr,
                                        "line_text": line,
                                        "words": json_words })
             else:
                 if('lines' in line):
-                    missline = re.split('miss[_ ]\"', re.split('[_ ]lines', line)[0])[1]
+                    missline = missing_start_pattern.split(missing_end_pattern.split(line, 1)[0])[1]
                     if(missline == '?'):
                         missline = 0
                     else:
@@ -132,192 +506,967 @@ def poemtextjson(text):
 #     return [text, errcode] # Just to show that these functions return the modified JSON and maybe some extra metadata.
 
 
-def analyze_length(text):
-    """ Counts the number of stanzas, lines and words in a JSON-compatible poem. """
-    stanzas = 0
-    lines = 0
-    words = 0
+class Analyzer:
+    """ Base class of the analyzers that run_analyzers() runs on a
+    JSON-compatible poem (or part) in a single traversal.
+    An analyzer overrides the hooks it needs; they are called in the
+    order of the traversal, for every analyzer in turn:
+    begin(text), stanza(stanza), line(line, stanza), word(word, line, stanza)
+    for the words with a text, line_end(line, stanza), stanza_end(stanza)
+    and end(text). The tools are the external tools of the run
+    (like the eSpeak worker under "espeak"), and its RunMetrics under "metrics".
+    For incremental runs (see analysis_plan()), the version has to be
+    raised whenever the results of the analyzer change; requires names the
+    analyses whose results it uses, and independent_parts tells that
+    it can run on the changed parts of a poem only, as its results are
+    not summed over the parts (see sum_parts()). """
+
+    version = 1
+    requires = []
+    independent_parts = False
+
+    def __init__(self, tools=None):
+        if(tools is None):
+            tools = dict()
+        self.tools = tools
+
+    def fingerprint(self):
+        """ Identifies the code and the resources of the analyzer. """
+        return type(self).__name__ + ':' + str(self.version)
+
+    def say(self, text, end='\n'):
+        """ Prints a progress message, unless the run is quiet. """
+        metrics = self.tools.get("metrics")
+        if(metrics is None or not metrics.quiet):
+            print(text, end=end)
+
+    def begin(self, text):
+        pass
+
+    def stanza(self, stanza):
+        pass
+
+    def line(self, line, stanza):
+        pass
+
+    def word(self, word, line, stanza):
+        pass
+
+    def line_end(self, line, stanza):
+        pass
+
+    def stanza_end(self, stanza):
+        pass
+
+    def end(self, text):
+        pass
+
+
+def timed_hook(hook, timer):
+    """ Returns a hook that adds the time spent in the given one to a timer
+    (one of the timers of a RunMetrics). """
+    perf_counter = time.perf_counter
+
+    def run(*args):
+        start = perf_counter()
+        hook(*args)
+        timer[0] += perf_counter() - start
+    return run
+
+
+def hooks(analyzers, name, metrics=None):
+    """ Returns the hooks of the analyzers that override the given one.
+    With metrics, the hooks are timed under the name of their analyzer. """
+    found = [analyzer for analyzer in analyzers
+             if getattr(type(analyzer), name) is not getattr(Analyzer, name)]
+    if(metrics is None):
+        return [getattr(analyzer, name) for analyzer in found]
+    timers = []
+    for analyzer in found:
+        metrics.add_time("analyzer." + type(analyzer).__name__, 0, 0)
+        timers.append(metrics.timers["analyzer." + type(analyzer).__name__])
+    return [timed_hook(getattr(found[a], name), timers[a]) for a in range(len(found))]
+
+
+def run_analyzers(text, analyzers, metrics=None):
+    """ Runs the analyzers on a JSON-compatible poem or part
+    in one traversal of its stanzas, lines and words.
+    With metrics (a RunMetrics), the time spent in each analyzer is recorded. """
+    stanza_hooks = hooks(analyzers, 'stanza', metrics)
+    line_hooks = hooks(analyzers, 'line', metrics)
+    word_hooks = hooks(analyzers, 'word', metrics)
+    line_end_hooks = hooks(analyzers, 'line_end', metrics)
+    stanza_end_hooks = hooks(analyzers, 'stanza_end', metrics)
+    if(metrics is None):
+        begin_hooks = [analyzer.begin for analyzer in analyzers]
+        end_hooks = [analyzer.end for analyzer in analyzers]
+    else:
+        begin_hooks = hooks(analyzers, 'begin', metrics)
+        end_hooks = hooks(analyzers, 'end', metrics)
+        for analyzer in analyzers:
+            metrics.add_time("analyzer." + type(analyzer).__name__, 0)
+    for hook in begin_hooks:
+        hook(text)
     if("stanzas" in text):
         for stanza in text["stanzas"]:
-            stanzas += 1
+            for hook in stanza_hooks:
+                hook(stanza)
             if("lines" in stanza):
                 for line in stanza["lines"]:
-                    lines += 1
-                    if("words" in line):
+                    for hook in line_hooks:
+                        hook(line, stanza)
+                    if("words" in line and len(word_hooks) > 0):
                         for word in line["words"]:
                             if("word_text" in word):
-                                words += 1
-    text["number_of_stanzas"] = stanzas
-    text["number_of_lines"] = lines
-    text["number_of_words"] = words
-    return [text]
+                                for hook in word_hooks:
+                                    hook(word, line, stanza)
+                    for hook in line_end_hooks:
+                        hook(line, stanza)
+            for hook in stanza_end_hooks:
+                hook(stanza)
+    for hook in end_hooks:
+        hook(text)
+    return text
+
+
+def analyze_poem(text, analyzers, metrics=None):
+    """ Runs the analyzers on a JSON-compatible poem: on each of its parts
+    (summing their analytics afterwards), or on the poem itself. """
+    if("parts" in text):
+        for part in text["parts"]:
+            run_analyzers(part, analyzers, metrics)
+        sum_parts(text)
+    else:
+        run_analyzers(text, analyzers, metrics)
+    return text
+
+
+class LengthAnalyzer(Analyzer):
+    """ Counts the number of stanzas, lines and words. """
+
+    def begin(self, text):
+        self.stanzas = 0
+        self.lines = 0
+        self.words = 0
+
+    def stanza(self, stanza):
+        self.stanzas += 1
+
+    def line(self, line, stanza):
+        self.lines += 1
+
+    def word(self, word, line, stanza):
+        self.words += 1
+
+    def end(self, text):
+        text["number_of_stanzas"] = self.stanzas
+        text["number_of_lines"] = self.lines
+        text["number_of_words"] = self.words
+
+
+def analyze_length(text):
+    """ Counts the number of stanzas, lines and words in a JSON-compatible poem. """
+    return [run_analyzers(text, [LengthAnalyzer()])]
+
+
+def content_lemma(word):
+    """ Returns the lemma of a word analyzed by analyze_morph() if it is
+    a content word (a noun, a verb, an adverb or an adjective)
+    with a lowercase lemma, otherwise None. """
+    if("word_text" in word and "lemma" in word):
+        morphology = word["morphology"]
+        if(("[N]" in morphology or "[V]" in morphology or "[Adv]" in morphology or "[Adj]" in morphology) and word["lemma"].lower() == word["lemma"]):
+            return word["lemma"]
+    return None
+
+
+class WordstatAnalyzer(Analyzer):
+    """ Counts the lemmas of the content words (nouns, verbs, adverbs
+    and adjectives) analyzed by analyze_morph().
+    The exact counts of the units analyzed are kept until
+    take_frequencies(), as the wordstat only holds the frequent lemmas. """
+
+    requires = ["morphology"]
+
+    def __init__(self, tools=None):
+        Analyzer.__init__(self, tools)
+        self.frequencies = None
+
+    def take_frequencies(self):
+        """ Returns the exact counts of the content lemmas of the units
+        analyzed since the last call (None if there were none). """
+        frequencies = self.frequencies
+        self.frequencies = None
+        return frequencies
+
+    def begin(self, text):
+        self.wordstat = dict()
+        self.words = 0
+
+    def word(self, word, line, stanza):
+        lemma = content_lemma(word)
+        if(lemma is not None):
+            self.words += 1
+            if lemma not in self.wordstat:
+                self.wordstat[lemma] = 1
+            else:
+                self.wordstat[lemma] += 1
+
+    def end(self, text):
+        wordstat = self.wordstat
+        words = self.words
+        if(self.frequencies is None):
+            self.frequencies = dict()
+        for lemma in wordstat:
+            self.frequencies[lemma] = self.frequencies.get(lemma, 0) + wordstat[lemma]
+        if(len(wordstat) == 0):
+            text["wordstat"] = { "_vocabulary": 0, "_repetitivity": 1 }
+        else:
+            text["wordstat"] = { "_vocabulary": len(wordstat), "_repetitivity": words/len(wordstat) }
+        wordstat = {key: val for key, val in sorted(wordstat.items(), key = lambda ele: ele[1], reverse=True)}
+        for k in wordstat.keys():
+            if(wordstat[k] > words/len(wordstat)):
+                text["wordstat"][k] = wordstat[k]
 
 
 def analyze_wordstat(text):
     """ Counts the number of stanzas, lines and words in a JSON-compatible poem. """
-    wordstat = dict()
-    words = 0
-    if("stanzas" in text):
-        for stanza in text["stanzas"]:
-            if("lines" in stanza):
-                for line in stanza["lines"]:
-                    if("words" in line):
-                        for word in line["words"]:
-                            if("lemma" in word):
-                                if(("[N]" in word["morphology"] or "[V]" in word["morphology"] or "[Adv]" in word["morphology"] or "[Adj]" in word["morphology"]) and word["lemma"].lower() == word["lemma"]):
-                                    words += 1
-                                    if word["lemma"] not in wordstat:
-                                        wordstat[word["lemma"]] = 1
-                                    else:
-                                        wordstat[word["lemma"]] += 1
-    if(len(wordstat) == 0):
-        text["wordstat"] = { "_vocabulary": 0, "_repetitivity": 1 }
-    else:
-        text["wordstat"] = { "_vocabulary": len(wordstat), "_repetitivity": words/len(wordstat) }
-    wordstat = {key: val for key, val in sorted(wordstat.items(), key = lambda ele: ele[1], reverse=True)}
-    for k in wordstat.keys():
-        if(wordstat[k] > words/len(wordstat)):
-            text["wordstat"][k] = wordstat[k]
-    return [text]
+    return [run_analyzers(text, [WordstatAnalyzer()])]
+
+
+vowels = 'aeiouűáéúőóüöíAEIOUŰÁÉÚŐÓÜÖÍ'
+vowel_pattern = re.compile(r'[' + vowels + ']')
+syllable_pattern = re.compile(r'[' + vowels + '][^' + vowels + ']*') # A vowel and the consonants after it.
+metric_strip_pattern = re.compile(r'[ ,.;:!?\-–\'"…]')
+word_syllables = dict() # Syllable count and stress pattern by word form.
+syllable_quantities = dict() # Quantity by syllable (a vowel and the consonants after it).
+
+
+def syllables_of_word(wordtext):
+    """ Returns the syllable count and the stress pattern of a word form. """
+    if(wordtext not in word_syllables):
+        syllcount = len(vowel_pattern.findall(wordtext))
+        if(syllcount == 0):
+            stress = ''
+        elif(syllcount == 1):
+            stress = '.' # One-syllable words count as unstressed. Watch out for the orthograph of prepositions!
+        else:
+            stress = '|' + '.' * (syllcount - 1) # The first syllable is stressed in Hungarian.
+        word_syllables[wordtext] = (syllcount, stress)
+    return word_syllables[wordtext]
+
+
+def syllable_quantity(a):
+    """ Returns the quantity of a syllable: '-' for long, 'U' for short. """
+    if(a not in syllable_quantities):
+        if(a.lower()[0] in ['ű', 'á', 'é', 'ú', 'ő', 'ó', 'í']):
+            quantity = '-'
+        elif(len(a) > 4 or (len(a) > 3 and 'dzs' not in a)):
+            quantity = '-'
+        elif(len(a) < 3 or (len(a) == 4 and 'dzs' in a)):
+            quantity = 'U'
+        elif(a[1:] not in ['cs', 'dz', 'gy', 'ly', 'ny', 'sz', 'ty', 'zs']):
+            quantity = '-'
+        else:
+            quantity = 'U'
+        syllable_quantities[a] = quantity
+    return syllable_quantities[a]
+
+
+def metric_pattern(linetext):
+    """ Returns the metric pattern of a line. """
+    linetext = metric_strip_pattern.sub('', linetext)
+    quantities = syllable_quantities
+    spatt = ''.join([quantities[a] if a in quantities else syllable_quantity(a) for a in syllable_pattern.findall(linetext)])
+    if(spatt[-1] == 'U'):
+        spatt = spatt[:-1] + '-' # The last syllable is always long.
+    return spatt
+
+
+class SyllableAnalyzer(Analyzer):
+    """ Analyzes the syllabic structure: syllable counts, stress and metric
+    patterns of the lines, and the statistics of long and stressed syllables. """
+
+    def begin(self, text):
+        self.syllstat = dict()
+        self.stressstat = dict()
+
+    def stanza(self, stanza):
+        self.syllables = []
+
+    def line(self, line, stanza):
+        self.syllline = 0
+        self.stressline = 0
+        self.stress = []
+        line["stress_pattern"] = ''
+
+    def word(self, word, line, stanza):
+        if(word == line["words"][-1]):
+            word["rhyme"] = True
+        syllcount, stress = syllables_of_word(word["word_text"])
+        word["syllable_count"] = syllcount # Syllable count of the current word.
+        self.syllline += syllcount
+        self.stress.append(stress)
+
+    def line_end(self, line, stanza):
+        syllline = self.syllline
+        line["stress_pattern"] = ''.join(self.stress)
+        if("line_text" in line):
+            spatt = metric_pattern(line["line_text"])
+            line["metric_pattern"] = spatt
+            if(len(spatt) < syllline):
+                raise IndexError("the metric pattern is shorter than the syllable count of the line")
+            if(syllline not in self.syllstat):
+                self.syllstat[syllline] = array('l', [0]) * syllline
+                self.stressstat[syllline] = array('l', [0]) * syllline
+            syllstat = self.syllstat[syllline]
+            stressstat = self.stressstat[syllline]
+            for a, mark in enumerate(spatt[:syllline]):
+                if(mark == '-'):
+                    syllstat[a] += 1
+            for a, mark in enumerate(line["stress_pattern"]):
+                if(mark == '|'):
+                    stressstat[a] += 1
+                    self.stressline += 1
+        line["syllable_count"] = syllline # Syllable count of the current line.
+        line["stress_count"] = self.stressline # Stress count of the current line.
+        self.syllables.append(str(syllline))
+
+    def stanza_end(self, stanza):
+        stanza["syllables"] = ', '.join(self.syllables) # Syllable pattern of the current stanza.
+
+    def end(self, text):
+        text["long_syllable_statistics"] = { key: list(self.syllstat[key]) for key in self.syllstat }
+        text["stressed_syllable_statistics"] = { key: list(self.stressstat[key]) for key in self.stressstat }
 
 
 def analyze_syll(text):
     """ Analyzes a JSON-compatible poem's syllabic structure
     and stores the results within the structure."""
-    syllstat = dict()
-    stressstat = dict()
-    if("stanzas" in text):
-        for stanza in text["stanzas"]:
-            syllables = []
-            if("lines" in stanza):
-                for line in stanza["lines"]:
-                    syllline = 0
-                    stressline = 0
-                    line["stress_pattern"] = ''
-                    if("words" in line):
-                        for word in line["words"]:
-                            if("word_text" in word):
-                                if(word == line["words"][-1]):
-                                    word["rhyme"] = True
-                                syllcount = len(re.findall(r'([aeiouűáéúőóüöíAEIOUŰÁÉÚŐÓÜÖÍ])', word["word_text"]))
-                                word["syllable_count"] = syllcount # Syllable count of the current word.
-                                syllline += syllcount
-                                if(syllcount == 1):
-                                    line["stress_pattern"] += '.' # One-syllable words count as unstressed. Watch out for the orthograph of prepositions!
-                                if(syllcount > 1):
-                                    line["stress_pattern"] += '|' # The first syllable is stressed in Hungarian.
-                                    for c in range(syllcount-1):
-                                        line["stress_pattern"] += '.' # Only the first syllable is stressed.
-                    if("line_text" in line):    
-                        linetext = line["line_text"]
-                        linetext = re.sub(r'[ ,.;:!?\-–\'"…]', '', linetext)
-                        # for a in range(len(linetext)):
-                        #     if(linetext[a].lower() in ['a', 'e', 'i', 'o', 'u', 'ű', 'á', 'é', 'ú', 'ő', 'ó', 'ü', 'ö', 'í']):
-                        #         if(
-                        linetext = re.sub(r'([aeiouűáéúőóüöíAEIOUŰÁÉÚŐÓÜÖÍ])', r'|\1', linetext)
-                        syll = linetext.split('|')
-                        spatt = ''
-                        for a in syll:
-                            if(len(a) > 0):
-                                if(a.lower()[0] in ['ű', 'á', 'é', 'ú', 'ő', 'ó', 'í']):
-                                    spatt += '-'
-                                if(a.lower()[0] in ['a', 'e', 'i', 'o', 'u', 'ü', 'ö']):
-                                    # if(len(a) > 4 or (len(a) > 3 and 'dzs' not in a)):
-                                    if(len(a) > 4 or (len(a) > 3 and 'dzs' not in a)):
-                                        spatt += '-'
-                                    if(len(a) < 3 or (len(a) == 4 and 'dzs' in a)):
-                                        spatt += 'U'
-                                    if(len(a) == 3):
-                                        if(a[1:] not in ['cs', 'dz', 'gy', 'ly', 'ny', 'sz', 'ty', 'zs']):
-                                            spatt += '-'
-                                        else:
-                                            spatt += 'U'
-                                # print(a + '(' + spatt[-1] + ')', end='')
-                        # print(spatt)
-                        if(spatt[-1] == 'U'):
-                            spatt = spatt[:-1] + '-' # The last syllable is always long.
-                        # print(line["line_text"])
-                        # for s in spatt:
-                        #     print(s, end=' ')
-                        # print('')
-                        line["metric_pattern"] = spatt
-                        if(syllline not in syllstat):
-                            syllstat[syllline] = list()
-                            for a in range(syllline):
-                                syllstat[syllline].append(0)
-                        if(syllline not in stressstat):
-                            stressstat[syllline] = list()
-                            for a in range(syllline):
-                                stressstat[syllline].append(0)
-                        # if(syllline > len(spatt)): # For debugging.
-                        #     print(linetext)
-                        #     print('! ' + str(syllline) + ' ' + str(len(spatt)))
-                        for a in range(syllline):
-                            if(spatt[a] == '-'):
-                                syllstat[syllline][a] += 1
-                        for a in range(syllline):
-                            if(line["stress_pattern"][a] == '|'):
-                                stressstat[syllline][a] += 1
-                                stressline += 1
-                    line["syllable_count"] = syllline # Syllable count of the current line.
-                    line["stress_count"] = stressline # Stress count of the current line.
-                    syllables.append(str(syllline))
-            stanza["syllables"] = ', '.join(syllables) # Syllable pattern of the current stanza.
-            # stanza["syllable_length_statistics"] = syllstat
-    text["long_syllable_statistics"] = syllstat
-    text["stressed_syllable_statistics"] = stressstat
-    # print('')
-    return [text]
-
-def analyze_phonetic(text):
+    return [run_analyzers(text, [SyllableAnalyzer()])]
+
+def espeak_ipa(word, voice='hu-hu'):
+    """ Transcribes one word with a separate eSpeak call. """
+    ipa = subprocess.check_output(["espeak", "-q", "--ipa", '-v', voice, word]).decode('utf-8')
+    ipa = ipa.replace('\n', ' ')
+    return re.sub(' +', '', ipa)
+
+
+def line_buffered(command):
+    """ Makes a command flush its output after every line, if possible.
+    Most tools do not flush their output when writing into a pipe. """
+    if(shutil.which("stdbuf") is not None):
+        return ["stdbuf", "-oL"] + command
+    return command
+
+
+class ToolSession:
+    """ Base class of the long-lived external tools that are fed
+    through their standard input and read from their standard output.
+    With metrics (a RunMetrics), the processes started and the time
+    of the exchanges with the tool are recorded.
+    A tool that does not answer a line within timeout seconds (None waits
+    forever) is killed and restarted like a tool that died, so a tool that
+    keeps its output in a buffer cannot hang the run. """
+
+    name = "tool"
+
+    def __init__(self, retries=1, metrics=None, timeout=60):
+        self.retries = retries
+        self.metrics = metrics
+        self.timeout = timeout
+        self.process = None
+        self.lines = None # The lines read from the tool by the reader thread.
+        self.starts = 0 # Number of processes started (restarts included).
+
+    def command(self):
+        raise NotImplementedError
+
+    def start(self):
+        self.process = subprocess.Popen(self.command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, encoding='utf-8')
+        # Reading from another thread, so that readline() can give up waiting.
+        self.lines = queue.Queue()
+        threading.Thread(target=self._read, args=(self.process.stdout, self.lines), daemon=True).start()
+        self.starts += 1
+        if(self.metrics is not None):
+            self.metrics.count("processes." + self.name)
+
+    def close(self):
+        if(self.process is not None):
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write(self, payload):
+        try:
+            self.process.stdin.write(payload)
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            pass # The reader notices the dead process.
+
+    def _read(self, stdout, lines):
+        try:
+            for line in stdout:
+                lines.put(line)
+        except (OSError, ValueError):
+            pass
+        lines.put('')
+
+    def readline(self):
+        try:
+            line = self.lines.get(timeout=self.timeout)
+        except queue.Empty:
+            message = self.name + " did not answer in " + str(self.timeout) + " seconds."
+            if(shutil.which("stdbuf") is None):
+                message += " stdbuf is not installed, so the tool may keep its output in a buffer."
+            raise RuntimeError(message)
+        if(line == ''):
+            raise RuntimeError(self.name + " exited unexpectedly.")
+        return line
+
+    def exchange(self, payload, read):
+        """ Sends the payload to the tool and returns the result of read().
+        The tool is (re)started when needed: if it dies during a batch,
+        it is restarted and the whole batch is sent again. """
+        if(self.metrics is not None):
+            with self.metrics.timed("tool." + self.name):
+                return self._exchange(payload, read)
+        return self._exchange(payload, read)
+
+    def _exchange(self, payload, read):
+        attempt = 0
+        while True:
+            if(self.process is None or self.process.poll() is not None):
+                self.start()
+            # Writing from another thread, so that neither side blocks on a full pipe.
+            writer = threading.Thread(target=self._write, args=(payload,))
+            writer.start()
+            try:
+                result = read()
+            except (OSError, RuntimeError):
+                self.process.kill()
+                writer.join()
+                self.close()
+                attempt += 1
+                if(attempt > self.retries):
+                    raise
+            else:
+                writer.join()
+                return result
+
+
+class EspeakWorker(ToolSession):
+    """ A long-lived eSpeak process that transcribes words in batches.
+    eSpeak reads its standard input line by line, so every word is sent on
+    its own line followed by a separator line. The transcription of the
+    separator (calibrated with a single eSpeak call at startup) marks the end
+    of each word's output, which keeps the results aligned word by word. """
+
+    name = "eSpeak"
+
+    def __init__(self, voice='hu-hu', separator='1234567', retries=1, metrics=None, timeout=60):
+        ToolSession.__init__(self, retries, metrics, timeout)
+        self.voice = voice
+        self.separator = separator
+        self.marker = None
+
+    def command(self):
+        return line_buffered(["espeak", "-q", "--ipa", '-v', self.voice])
+
+    def start(self):
+        if(self.marker is None):
+            self.marker = espeak_ipa(self.separator, self.voice)
+            if(self.metrics is not None):
+                self.metrics.count("processes." + self.name)
+        ToolSession.start(self)
+
+    def transcribe(self, words):
+        """ Returns the IPA transcriptions of a list of words, in order. """
+        if(len(words) == 0):
+            return []
+
+        def read():
+            results = []
+            current = []
+            while(len(results) < len(words)):
+                ipa = re.sub(' +', '', self.readline().replace('\n', ' '))
+                if(ipa == self.marker):
+                    results.append(''.join(current))
+                    current = []
+                else:
+                    current.append(ipa)
+            return results
+        return self.exchange(''.join(word + '\n' + self.separator + '\n' for word in words), read)
+
+
+class HfstSession(ToolSession):
+    """ A long-lived hfst-lookup process that keeps the transducer loaded.
+    A batch of words is sent one word per line, closed by a sentinel word;
+    the analysis block of the sentinel marks the end of the batch. """
+
+    name = "hfst-lookup"
+
+    def __init__(self, transducer="emMorphOMH_distrib/hfst/OMH.hfstol", sentinel="[ANAC_EOB]", retries=1, metrics=None, timeout=60):
+        ToolSession.__init__(self, retries, metrics, timeout)
+        self.transducer = transducer
+        self.sentinel = sentinel
+
+    def command(self):
+        return line_buffered(["hfst-lookup", "--pipe-mode=input", "--cascade=composition", self.transducer])
+
+    def lookup(self, wordlist):
+        """ Returns the output of hfst-lookup for a list of words,
+        exactly as a separate hfst-lookup call would print it. """
+        return self.lookup_batches([wordlist])[0]
+
+    def lookup_batches(self, wordlists):
+        """ Analyzes several lists of words in one pass.
+        Every list is closed by the sentinel, so the output can be cut back
+        into one hfst-lookup output per list. """
+        sent = [wordlist for wordlist in wordlists if len(wordlist) > 0]
+        if(len(sent) == 0):
+            return ['' for wordlist in wordlists]
+
+        def read():
+            outputs = []
+            for wordlist in sent:
+                lines = []
+                line = self.readline()
+                while(not line.startswith(self.sentinel + '\t')):
+                    lines.append(line)
+                    line = self.readline()
+                while(line != '\n'): # The rest of the sentinel's block.
+                    line = self.readline()
+                outputs.append(''.join(lines))
+            return outputs
+        outputs = iter(self.exchange(''.join('\n'.join(wordlist) + '\n' + self.sentinel + '\n' for wordlist in sent), read))
+        return [next(outputs) if len(wordlist) > 0 else '' for wordlist in wordlists]
+
+
+class EspeakPool:
+    """ A small pool of eSpeak workers sharing the batches between them. """
+
+    def __init__(self, size=2, voice='hu-hu'):
+        self.voice = voice
+        self.workers = [EspeakWorker(voice) for a in range(size)]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def transcribe(self, words):
+        """ Returns the IPA transcriptions of a list of words, in order. """
+        size = -(-len(words) // len(self.workers))
+        if(size < 100):
+            return self.workers[0].transcribe(words)
+        chunks = [words[a:a + size] for a in range(0, len(words), size)]
+        results = [None] * len(chunks)
+
+        def run(a):
+            results[a] = self.workers[a].transcribe(chunks[a])
+        threads = [threading.Thread(target=run, args=(a,)) for a in range(len(chunks))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        out = []
+        for a in range(len(chunks)):
+            if(results[a] is None):
+                raise RuntimeError("eSpeak worker " + str(a) + " failed.")
+            out.extend(results[a])
+        return out
+
+
+def espeak_version():
+    """ Returns the version string of the installed eSpeak. """
+    return subprocess.check_output(["espeak", "--version"]).decode('utf-8').strip()
+
+
+class IPACache:
+    """ Persistent cache of IPA transcriptions in an SQLite file,
+    keyed by the cleaned word text, the eSpeak voice and the eSpeak version,
+    with an in-memory LRU layer on top.
+    Words missing from both layers are sent to the backend (an eSpeak worker
+    or pool, started only when the first miss occurs) in one batch. """
+
+    def __init__(self, location="ipacache.db", backend=None, voice='hu-hu', version=None, capacity=100000, metrics=None):
+        self.voice = voice
+        self.metrics = metrics # Given to the eSpeak worker started by the cache.
+        if(version is None):
+            version = espeak_version()
+        self.version = version
+        self.capacity = capacity
+        self.backend = backend
+        self.own_backend = backend is None
+        self.memory = OrderedDict()
+        self.hits = 0 # Found in memory.
+        self.disk_hits = 0 # Found in the SQLite file.
+        self.misses = 0 # Transcribed by eSpeak (every occurrence).
+        self.new_forms = 0 # Distinct words sent to eSpeak.
+        import sqlite3
+        self.db = sqlite3.connect(location, timeout=60) # Parallel workers share the file.
+        self.db.execute("CREATE TABLE IF NOT EXISTS ipa (word TEXT, voice TEXT, version TEXT, ipa TEXT, "
+                        "PRIMARY KEY (word, voice, version))")
+        self.db.commit()
+
+    def close(self):
+        if(self.own_backend and self.backend is not None):
+            self.backend.close()
+            self.backend = None
+        if(self.db is not None):
+            self.db.close()
+            self.db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def remember(self, word, ipa):
+        self.memory[word] = ipa
+        self.memory.move_to_end(word)
+        if(len(self.memory) > self.capacity):
+            self.memory.popitem(last=False)
+
+    def lookup(self, word):
+        """ Returns the cached transcription of a word, or None. """
+        if(word in self.memory):
+            self.memory.move_to_end(word)
+            self.hits += 1
+            return self.memory[word]
+        row = self.db.execute("SELECT ipa FROM ipa WHERE word = ? AND voice = ? AND version = ?",
+                              (word, self.voice, self.version)).fetchone()
+        if(row is not None):
+            self.disk_hits += 1
+            self.remember(word, row[0])
+            return row[0]
+        return None
+
+    def transcribe(self, words):
+        """ Returns the IPA transcriptions of a list of words, in order. """
+        results = [self.lookup(word) for word in words]
+        missing = dict() # The missing words, in order.
+        for a in range(len(words)):
+            if(results[a] is None and words[a] not in missing):
+                missing[words[a]] = True
+        missing = list(missing)
+        if(len(missing) > 0):
+            self.misses += results.count(None)
+            self.new_forms += len(missing)
+            if(self.backend is None):
+                self.backend = EspeakWorker(self.voice, metrics=self.metrics)
+            ipas = self.backend.transcribe(missing)
+            self.db.executemany("INSERT OR REPLACE INTO ipa VALUES (?, ?, ?, ?)",
+                                [(missing[a], self.voice, self.version, ipas[a]) for a in range(len(missing))])
+            self.db.commit()
+            new = dict(zip(missing, ipas))
+            for a in range(len(words)):
+                if(results[a] is None):
+                    results[a] = new[words[a]]
+            for word in missing:
+                self.remember(word, new[word])
+        return results
+
+    def statistics(self):
+        """ Returns the hit and miss counters of the cache. """
+        lookups = self.hits + self.disk_hits + self.misses
+        return { "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "new_forms": self.new_forms,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups > 0 else 0 }
+
+
+class PhoneticAnalyzer(Analyzer):
+    """ Creates the phonetic transcription of the words. The words of a poem
+    are sent to the transcriber of the run in one batch: to tools["espeak"]
+    (an eSpeak worker or pool, or an IPACache), or without one, to a worker
+    started for this poem only. """
+
+    independent_parts = True
+
+    def fingerprint(self):
+        espeak = self.tools.get("espeak")
+        version = getattr(espeak, "version", None)
+        if(version is None):
+            version = espeak_version()
+        return Analyzer.fingerprint(self) + ':' + getattr(espeak, "voice", 'hu-hu') + ':' + version
+
+    def begin(self, text):
+        self.words = []
+
+    def word(self, word, line, stanza):
+        self.words.append(word)
+
+    def end(self, text):
+        words = self.words
+        if(len(words) > 0):
+            wordtexts = [re.sub('^\\-', '', word["word_text"]) for word in words]
+            if(self.tools.get("espeak") is None):
+                with EspeakWorker() as worker:
+                    ipas = worker.transcribe(wordtexts)
+            else:
+                ipas = self.tools["espeak"].transcribe(wordtexts)
+            for a in range(len(words)):
+                words[a]["word_ipa_espeak"] = ipas[a]
+            self.say('|' * (len(words) // 100), end='')
+        self.say('')
+        self.words = []
+
+
+def analyze_phonetic(text, espeak=None):
     """ Creates the phonetic transcription of a JSON-compatible poem
-    and stores the results within the structure. """
-    a = 0
-    if("stanzas" in text):
-        for stanza in text["stanzas"]:
-            # Here are stuff you do with stanzas.
-            if("lines" in stanza):
-                for line in stanza["lines"]:
-                    # Here are stuff you do with lines.
-                    if("words" in line):
-                        for word in line["words"]:
-                            if("word_text" in word):
-                                # Here are stuff you do with words.
-                                # epi = epitran.Epitran('hun-Latn')
-                                # epi = epi.transliterate(word["word_text"])
-                                # epi = epi.replace('\n', ' ')
-                                # epi = re.sub(' +', ' ', epi)
-                                ipa = subprocess.check_output(["espeak", "-q", "--ipa", '-v', 'hu-hu', re.sub('^\-', '', word["word_text"])]).decode('utf-8')
-                                ipa = ipa.replace('\n', ' ')
-                                ipa = re.sub(' +', '', ipa)
-                                a += 1
-                                if(a >= 100):
-                                    # print(word["word_text"] + '\t' + ipa)
-                                    print('|', end='')
-                                    a = 0
-                                word["word_ipa_espeak"] = ipa
-                    # Here are also stuff you do with lines.
-            # Here are also stuff you do with stanzas.
-    print('')
-    return [text] # Just to show that these functions return the modified JSON and maybe some extra metadata.
-
-
-def analyze_morph(text, normalizator):
-    """ Analyzes a JSON-compatible poem's morphology
-    and stores the results within the structure. """
-    global unanalyzed_pos
-    global elonorm_hibak
+    and stores the results within the structure.
+    The words are sent to the given transcriber (an eSpeak worker or pool,
+    or an IPACache) in one batch; without one, a worker is started
+    for this poem only. """
+    return [run_analyzers(text, [PhoneticAnalyzer({ "espeak": espeak })])] # Just to show that these functions return the modified JSON and maybe some extra metadata.
+
+
+def file_fingerprint(location):
+    """ Returns the SHA-1 hash and the modification time of a file. """
+    sha = hashlib.sha1()
+    file = open(location, "rb")
+    for block in iter(lambda: file.read(1 << 20), b''):
+        sha.update(block)
+    file.close()
+    return sha.hexdigest() + ':' + str(os.path.getmtime(location))
+
+
+class MorphCache:
+    """ Cache of the hfst analyses of the normalized word forms in front of
+    an hfst session, with the same lookup() and lookup_batches() methods.
+    Only forms that were never seen before are sent to hfst-lookup.
+    The filtered analyses and their conversion into PurePos candidates
+    (see convert_morph()) are remembered as well.
+    With a location, the analyses and their conversions are kept in an
+    SQLite file between runs; it is emptied when the transducer file changes,
+    and the conversions also when morphology_version changes. """
+
+    def __init__(self, hfst=None, location=None):
+        if(hfst is None):
+            hfst = HfstSession()
+        self.hfst = hfst
+        self.analyses = dict() # Raw hfst-lookup output of each form.
+        self.filtered = dict() # See filter_derivations().
+        self.converted = dict() # See convert().
+        self.hits = 0
+        self.misses = 0 # Every occurrence not found in the cache.
+        self.new_forms = 0 # Distinct forms sent to hfst-lookup.
+        self.db = None
+        self.stored = 0, 0 # Number of entries read from the SQLite file.
+        self.fingerprint = None # Of the transducer, with a location.
+        if(location is not None):
+            import sqlite3
+            fingerprint = file_fingerprint(hfst.transducer)
+            self.fingerprint = fingerprint
+            self.db = sqlite3.connect(location, timeout=60) # Parallel workers share the file.
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS morph (form TEXT PRIMARY KEY, analysis TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS conversion (analysis TEXT PRIMARY KEY, candidate TEXT)")
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'transducer'").fetchone()
+            if(row is None or row[0] != fingerprint):
+                self.db.execute("DELETE FROM morph")
+                self.db.execute("DELETE FROM conversion")
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('transducer', ?)", (fingerprint,))
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'conversion'").fetchone()
+            if(row is None or row[0] != str(morphology_version)):
+                self.db.execute("DELETE FROM conversion") # Made by an older convert().
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('conversion', ?)", (str(morphology_version),))
+            self.db.commit()
+            self.analyses.update(self.db.execute("SELECT form, analysis FROM morph"))
+            self.converted.update(self.db.execute("SELECT analysis, candidate FROM conversion"))
+            self.stored = len(self.analyses), len(self.converted)
+
+    def close(self):
+        if(self.db is not None):
+            # Dictionaries keep their order, so the new entries come last.
+            self.db.executemany("INSERT OR REPLACE INTO morph VALUES (?, ?)",
+                                list(self.analyses.items())[self.stored[0]:])
+            self.db.executemany("INSERT OR REPLACE INTO conversion VALUES (?, ?)",
+                                list(self.converted.items())[self.stored[1]:])
+            self.db.commit()
+            self.db.close()
+            self.db = None
+        self.hfst.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def lookup(self, wordlist):
+        """ Returns the output of hfst-lookup for a list of words,
+        exactly as a separate hfst-lookup call would print it. """
+        return self.lookup_batches([wordlist])[0]
+
+    def lookup_batches(self, wordlists):
+        """ Analyzes several lists of words, sending the new forms
+        of all of them to hfst in one batch. """
+        new = dict() # The new forms, in order.
+        for wordlist in wordlists:
+            for word in wordlist:
+                if(word in self.analyses):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+                    new[word] = True
+        new = list(new)
+        if(len(new) > 0):
+            self.new_forms += len(new)
+            # One block of analyses per word, each closed by an empty line.
+            blocks = [block + '\n' for block in self.hfst.lookup(new).split('\n\n')[:-1]]
+            if(len(blocks) != len(new)):
+                # Cannot tell which analysis belongs to which word: nothing is cached.
+                return self.hfst.lookup_batches(wordlists)
+            for a in range(len(new)):
+                self.analyses[new[a]] = blocks[a]
+        return [''.join(self.analyses[word] + '\n' for word in wordlist) for wordlist in wordlists]
+
+    def statistics(self):
+        """ Returns the hit and miss counters of the cache. """
+        lookups = self.hits + self.misses
+        return { "hits": self.hits,
+                "misses": self.misses,
+                "new_forms": self.new_forms,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0 }
+
+
+class PurePosSession(ToolSession):
+    """ A long-lived PurePos tagger that keeps the model loaded in one JVM.
+    PurePos tags its input sentence by sentence (one sentence per line),
+    so a batch is closed by a sentinel sentence whose tagged line marks
+    the end of the batch. """
+
+    name = "PurePos"
+
+    def __init__(self, jar="purepos/purepos-2.1.one-jar.jar", model="purepos/omh.model", sentinel="ANACEOB", retries=1, metrics=None, timeout=60):
+        ToolSession.__init__(self, retries, metrics, timeout)
+        self.jar = jar
+        self.model = model
+        self.sentinel = sentinel
+
+    def command(self):
+        return ["java", "-jar", self.jar, "tag", "-a", "none", "-m", self.model]
+
+    def tag(self, morphpure):
+        """ Returns the output of PurePos for the converted analyses,
+        exactly as a separate PurePos call would print it. """
+        return self.tag_batches([morphpure])[0]
+
+    def tag_batches(self, morphpures):
+        """ Tags several converted texts in one pass.
+        Every text is closed by the sentinel sentence, so the output can be
+        cut back into one PurePos output per text. """
+        sent = [morphpure if morphpure[-1] == '\n' else morphpure + '\n' for morphpure in morphpures if len(morphpure) > 0]
+        if(len(sent) == 0):
+            return ['' for morphpure in morphpures]
+
+        def read():
+            outputs = []
+            for morphpure in sent:
+                lines = []
+                line = self.readline()
+                while(not line.startswith(self.sentinel + '#')):
+                    lines.append(line)
+                    line = self.readline()
+                outputs.append(''.join(lines))
+            return outputs
+        outputs = iter(self.exchange(''.join(morphpure + self.sentinel + '\n' for morphpure in sent), read))
+        return [next(outputs) if len(morphpure) > 0 else '' for morphpure in morphpures]
+
+
+class NameTrie:
+    """ Prefix trie of proper names.
+    Tells in one walk along a word how many names the word starts with. """
+
+    def __init__(self, names):
+        self.root = dict()
+        for name in names:
+            node = self.root
+            for c in name:
+                node = node.setdefault(c, dict())
+            node[''] = node.get('', 0) + 1 # The number of names ending here.
+
+    def matches(self, word):
+        """ Returns the number of names the word starts with. """
+        node = self.root
+        count = node.get('', 0)
+        for c in word:
+            node = node.get(c)
+            if(node is None):
+                break
+            count += node.get('', 0)
+        return count
+
+
+class Normalizer:
+    """ The resources of one normalizer ('tinodi' or 'historias'):
+    the memory-based dictionary, the character-level rewrite rules
+    and the proper names. See get_normalizer(). """
+
+    def __init__(self, normalizator):
+        import elonorm
+        self.normalizator = normalizator
+        if(normalizator == 'tinodi'):
+            self.memdict = {}
+            self.charrules = dict()
+        else:
+            self.memdict = elonorm.memory_dict_from_file('elonorm/' + normalizator + '_szotar.csv')
+            self.charrules = elonorm.char_rules_from_file('elonorm/' + normalizator + '_char_subs.csv')
+        file = open('elonorm/proper_names.csv', "r")
+        self.propernames = NameTrie([name.replace('\n', '') for name in file.readlines()])
+        file.close()
+
+
+def normalizer_resources(normalizator):
+    """ Returns the files a normalizer is loaded from (see Normalizer). """
+    if(normalizator == 'tinodi'):
+        return ['elonorm/proper_names.csv']
+    return ['elonorm/' + normalizator + '_szotar.csv', 'elonorm/' + normalizator + '_char_subs.csv', 'elonorm/proper_names.csv']
+
+
+normalizers = dict()
+
+def get_normalizer(normalizator):
+    """ Returns the resources of a normalizer, loading them only once per process. """
+    if(normalizator not in normalizers):
+        normalizers[normalizator] = Normalizer(normalizator)
+    return normalizers[normalizator]
+
+
+def normalize_words(text, normalizator, context=None):
+    """ Normalizes the words of a JSON-compatible poem before the
+    morphological analysis, and stores the normalized forms within the structure.
+    Returns the list of normalized words with [EOL] and [EOS] markers,
+    the number of words and the number of prenormalized words. """
+    import elonorm
+    if(context is None):
+        context = default_context
     wordlist = []
     wordcount = 0
-    if(normalizator == 'tinodi'):
-        memdict = {}
-        charrules = dict()
-    else:
-        memdict = elonorm.memory_dict_from_file('elonorm/' + normalizator + '_szotar.csv')
-        charrules = elonorm.char_rules_from_file('elonorm/' + normalizator + '_char_subs.csv')
-    file = open('elonorm/proper_names.csv', "r")
-    properlist = file.readlines()
-    file.close()
+    normalizer = get_normalizer(normalizator)
+    memdict = normalizer.memdict
+    charrules = normalizer.charrules
     k = 0
     if("stanzas" in text):
         for stanza in text["stanzas"]:
@@ -331,11 +1480,10 @@ def analyze_morph(text, normalizator):
                                 wordtext = word["word_text"]
                                 wordcount += 1
                                 proper = False
-                                for name in properlist:
-                                    if(wordtext.startswith(name.replace('\n', '')) == True):
-                                        proper = True
-                                        print(line["line_text"])
-                                        print("Tulajdonnév: " + wordtext)
+                                for name in range(normalizer.propernames.matches(wordtext)):
+                                    proper = True
+                                    context.metrics.say(line["line_text"])
+                                    context.metrics.say("Tulajdonnév: " + wordtext)
                                 if wordtext in memdict:
                                     ''' Memory-based normalization, stores case. '''
                                     wordnorm = memdict[wordtext].strip('\n')
@@ -354,192 +1502,301 @@ def analyze_morph(text, normalizator):
                                 wordlist.append(wordnorm)
                     wordlist.append('[EOL]')
                 wordlist.append('[EOS]')
+    return [wordlist, wordcount, k]
 
-        """ Morphological analysis. """
-        file = open("morph.tmp", "w")
-        file.write('\n'.join(wordlist))
-        file.close()
-        morph = subprocess.check_output("hfst-lookup --pipe-mode=input --cascade=composition emMorphOMH_distrib/hfst/OMH.hfstol < morph.tmp", shell=True, executable="/bin/bash").decode()
-        
-        file = open("morphout.tmp", "w")
-        file2 = open("morphout2.tmp", "w")
-        morwords = morph.split('\n\n')
-        # Here we write the morphological analysis into the morphout.tmp file, but without
-        # any solution with a derivational suffix (so anything that contains '[_'.
-        # Words that only contain such solutions will be left intact, though.
-        morphnoderiv = ''
-        for mword in morwords:
-            mw = re.sub(r'.+\[_.*\n*', r'', mword)
-            if(len(mw)>0):
-                file.write(mw)
-                morphnoderiv += mw
-            else:
-                file.write(mword)
-                morphnoderiv += mword
-            file2.write(mword)
-            file2.write('\n\n')
-            file.write('\n\n')
-            morphnoderiv += '\n\n'
-        # file.write(morph)
-        file2.close()
-        file.close()        
-        morphpure = convert(morphnoderiv)
 
-        """ Morphological disambiguation. """
-        file = open("morph.tmp", "w")
-        file.write(morphpure)
-        file.close()
-        morphcomm = "java -jar purepos/purepos-2.1.one-jar.jar tag -a none -m purepos/omh.model -i morph.tmp"
-        # morphcomm = 'echo "' + morphpure + '" | java -jar purepos/purepos-2.1.one-jar.jar tag -a none -m purepos/omh.model -i morph.tmp'
-        puretext = subprocess.check_output(morphcomm, shell=True, executable="/bin/bash").decode()
-        file = open("pure.tmp", "w")
-        file.write(puretext)
-        file.close()
-        # os.remove("morph.tmp")
+derivation_pattern = re.compile(r'.+\[_.*\n*') # A solution with a derivational suffix.
 
-        """ Storing the data in the JSON structure. """
-        puretext = re.sub(r'\n', ' ', puretext)
-        purelist = puretext.split(' ')
-        # purelist = re.sub(r'\n\n', r'\n', puretext).split(' ')
-        hib = len(re.findall(r'\+\?', morph))
-        i = 0
-        j = 0
-        errlist = set()
-        for stanza in text["stanzas"]:
-            if("lines" in stanza):
-                for line in stanza["lines"]:
-                    if("words" in line):
-                        for word in line["words"]:
-                            if("word_text" in word):
-                                pure = purelist[i].split('#')
-                                if(len(pure) == 3):
-                                    if('?' not in pure[2]):
-                                        word["lemma"] = pure[1]
-                                        if(len(pure[2]) > 1):
-                                            if('[' in pure[2]):
-                                                morin = pure[2][1:-1] # Why is this doing the right thing in case of properly analyzed words, and not the right thing with the guesser?
-                                                # morin = pure[2]
-                                            else:
-                                                morin = pure[2]
+def filter_word(mword):
+    """ Removes the solutions with a derivational suffix
+    from the analyses of one word. """
+    mw = derivation_pattern.sub('', mword)
+    if(len(mw)>0):
+        return mw
+    return mword
+
+
+def filter_derivations(morph, filtered=None):
+    """ Removes from the output of hfst-lookup any solution
+    with a derivational suffix (so anything that contains '[_'.
+    Words that only contain such solutions will be left intact, though.
+    filtered may be a dictionary remembering the result for each word. """
+    morphnoderiv = []
+    for mword in morph.split('\n\n'):
+        if(filtered is None):
+            morphnoderiv.append(filter_word(mword))
+        else:
+            if(mword not in filtered):
+                filtered[mword] = filter_word(mword)
+            morphnoderiv.append(filtered[mword])
+        morphnoderiv.append('\n\n')
+    return ''.join(morphnoderiv)
+
+
+def convert_morph(morph, cache=None, context=None):
+    """ Filters and converts the output of hfst-lookup into PurePos input.
+    With a MorphCache, the words seen before are not filtered and converted again. """
+    if(cache is None):
+        return convert(filter_derivations(morph), context=context)
+    return convert(filter_derivations(morph, cache.filtered), cache.converted, context)
+
+
+def store_morph(text, puretext, guessed, context=None):
+    """ Stores the output of PurePos in a JSON-compatible poem.
+    guessed holds the positions of the words hfst could not analyze,
+    as collected by convert().
+    Returns the set of PurePos errors. """
+    if(context is None):
+        context = default_context
+    elonorm_hibak = context.elonorm_hibak
+    diagnostics = context.diagnostics
+    puretext = re.sub(r'\n', ' ', puretext)
+    purelist = puretext.split(' ')
+    # purelist = re.sub(r'\n\n', r'\n', puretext).split(' ')
+    guessed = set(guessed)
+    i = 0
+    j = 0
+    errlist = set()
+    for stanza in text["stanzas"]:
+        if("lines" in stanza):
+            for line in stanza["lines"]:
+                if("words" in line):
+                    for word in line["words"]:
+                        if("word_text" in word):
+                            pure = purelist[i].split('#')
+                            if(len(pure) == 3):
+                                if('?' not in pure[2]):
+                                    word["lemma"] = pure[1]
+                                    if(len(pure[2]) > 1):
+                                        if('[' in pure[2]):
+                                            morin = pure[2][1:-1] # Why is this doing the right thing in case of properly analyzed words, and not the right thing with the guesser?
+                                            # morin = pure[2]
                                         else:
                                             morin = pure[2]
-                                        morout = ""
-                                        for mor in morin.split(':'):
-                                            if(len(mor)>0):
-                                                morout = morout + "[" + mor + "]"
-                                        word["morphology"] = morout
-                                        # print(word["word_text"] + '\t' + word["lemma"] + '\t' + word["morphology"])
-                                        j += 1 # counting the successful analyses
                                     else:
-                                        # print('Error: ' + pure[0])
-                                        errlist.add('!' + '\t' + pure[0] + '\t' + pure[1] + '\t' + pure[2])
-                                i += 1
-                                if(i in unanalyzed_pos):
-                                    word["morphology_guessed"] = True
-                                    if("word_text_normalized" in word):
-                                        if(word["word_text"] not in elonorm_hibak):
-                                            elonorm_hibak[word["word_text"]] = [word["word_text_normalized"], 1]
-                                        else:
-                                            elonorm_hibak[word["word_text"]][1] += 1                                       
+                                        morin = pure[2]
+                                    morout = ""
+                                    for mor in morin.split(':'):
+                                        if(len(mor)>0):
+                                            morout = morout + "[" + mor + "]"
+                                    word["morphology"] = morout
+                                    # print(word["word_text"] + '\t' + word["lemma"] + '\t' + word["morphology"])
+                                    j += 1 # counting the successful analyses
+                                else:
+                                    # print('Error: ' + pure[0])
+                                    errlist.add('!' + '\t' + pure[0] + '\t' + pure[1] + '\t' + pure[2])
+                                    if(diagnostics is not None):
+                                        diagnostics.error('!' + '\t' + pure[0] + '\t' + pure[1] + '\t' + pure[2])
+                            i += 1
+                            if(i in guessed):
+                                word["morphology_guessed"] = True
+                                if("word_text_normalized" in word):
+                                    if(word["word_text"] not in elonorm_hibak):
+                                        elonorm_hibak[word["word_text"]] = [word["word_text_normalized"], 1]
+                                    else:
+                                        elonorm_hibak[word["word_text"]][1] += 1
+                                    if(diagnostics is not None):
+                                        diagnostics.normalization(word["word_text"], word["word_text_normalized"])
+    return errlist
+
+
+def print_morph_stats(wordcount, hib, k, context=None):
+    if(context is None):
+        context = default_context
     if(wordcount>0):
-        print('Words: ' + str(wordcount) + '\t\tGuessed: ' + str(hib) + ' (' + str(round(hib*100/wordcount)) + '%)\t\tPrenormalized: ' + str(round(k*100/wordcount)) + '%')
+        context.metrics.say('Words: ' + str(wordcount) + '\t\tGuessed: ' + str(hib) + ' (' + str(round(hib*100/wordcount)) + '%)\t\tPrenormalized: ' + str(round(k*100/wordcount)) + '%')
+
+
+def analyze_morph(text, normalizator, hfst=None, purepos=None, context=None):
+    """ Analyzes a JSON-compatible poem's morphology
+    and stores the results within the structure.
+    If an hfst session (or a MorphCache) or a PurePos session is given,
+    the poem is analyzed or disambiguated through it, otherwise a new
+    hfst-lookup or PurePos is started for this poem. """
+    if(context is None):
+        context = default_context
+    wordlist, wordcount, k = normalize_words(text, normalizator, context)
+    errlist = set()
+    hib = 0
+    if("stanzas" in text):
+        """ Morphological analysis. """
+        if(hfst is not None):
+            morph = hfst.lookup(wordlist)
+        else:
+            file = open(context.path("morph.tmp"), "w")
+            file.write('\n'.join(wordlist))
+            file.close()
+            context.metrics.count("processes.hfst-lookup")
+            with context.metrics.timed("tool.hfst-lookup"):
+                morph = subprocess.check_output("hfst-lookup --pipe-mode=input --cascade=composition emMorphOMH_distrib/hfst/OMH.hfstol < " + shlex.quote(context.path("morph.tmp")), shell=True, executable="/bin/bash").decode()
+        if(hfst is None):
+            morphnoderiv = filter_derivations(morph)
+            # The analyses are also written into the morphout.tmp (filtered)
+            # and morphout2.tmp (complete) files.
+            file = open(context.path("morphout.tmp"), "w")
+            file.write(morphnoderiv)
+            file.close()
+            file = open(context.path("morphout2.tmp"), "w")
+            file.write(''.join(mword + '\n\n' for mword in morph.split('\n\n')))
+            file.close()
+            with context.metrics.timed("morphology.convert"):
+                morphpure = convert(morphnoderiv, context=context)
+        else:
+            with context.metrics.timed("morphology.convert"):
+                morphpure = convert_morph(morph, hfst if isinstance(hfst, MorphCache) else None, context)
+
+        """ Morphological disambiguation. """
+        if(purepos is not None):
+            puretext = purepos.tag(morphpure)
+        else:
+            file = open(context.path("morph.tmp"), "w")
+            file.write(morphpure)
+            file.close()
+            morphcomm = "java -jar purepos/purepos-2.1.one-jar.jar tag -a none -m purepos/omh.model -i " + shlex.quote(context.path("morph.tmp"))
+            # morphcomm = 'echo "' + morphpure + '" | java -jar purepos/purepos-2.1.one-jar.jar tag -a none -m purepos/omh.model -i morph.tmp'
+            context.metrics.count("processes.PurePos")
+            with context.metrics.timed("tool.PurePos"):
+                puretext = subprocess.check_output(morphcomm, shell=True, executable="/bin/bash").decode()
+            file = open(context.path("pure.tmp"), "w")
+            file.write(puretext)
+            file.close()
+            # os.remove("morph.tmp")
+
+        """ Storing the data in the JSON structure. """
+        errlist = store_morph(text, puretext, context.unanalyzed_pos, context)
+        hib = morph.count('+?')
+    print_morph_stats(wordcount, hib, k, context)
     return [text, errlist]
 
 
+def analyze_morph_batch(units, hfst, purepos, context=None):
+    """ Analyzes the morphology of several JSON-compatible poems or parts
+    with one hfst-lookup and one PurePos pass, and stores the results within
+    the structures, exactly as analyze_morph() would do one by one.
+    units is a list of [text, normalizator] pairs, hfst is an hfst session
+    or a MorphCache.
+    Returns the set of PurePos errors. """
+    if(context is None):
+        context = default_context
+    batch = []
+    for unit in units:
+        if("stanzas" in unit[0]):
+            batch.append([unit[0]] + normalize_words(unit[0], unit[1], context))
+    # The sessions return one output per poem: the end of each poem's words
+    # is marked in the streams, so the analyses find their way back.
+    morphs = hfst.lookup_batches([unit[1] for unit in batch])
+    cache = hfst if isinstance(hfst, MorphCache) else None
+    morphpures = []
+    guessed = []
+    with context.metrics.timed("morphology.convert"):
+        for morph in morphs:
+            morphpures.append(convert_morph(morph, cache, context))
+            guessed.append(list(context.unanalyzed_pos))
+    puretexts = purepos.tag_batches(morphpures)
+    errlist = set()
+    for a in range(len(batch)):
+        text, wordlist, wordcount, k = batch[a]
+        errlist.update(store_morph(text, puretexts[a], guessed[a], context))
+        print_morph_stats(wordcount, morphs[a].count('+?'), k, context)
+    return errlist
+
+
 def sum_parts(text):
-    """ Sums certain analytics of a poem's parts. """
-    syllstat = dict()
-    stressstat = dict()
-    wordstat = dict()
-    stanzas = 0
-    lines = 0
-    words = 0
+    """ Sums certain analytics of a poem's parts (see Statistics).
+    The vocabulary and the repetitivity of the poem are the averages
+    of those of its parts. """
     if("parts" in text):
+        statistics = Statistics()
         for part in text["parts"]:
-            if("long_syllable_statistics" in part):
-                partstat = part["long_syllable_statistics"]
-                for stat in partstat.keys():
-                    if(stat not in syllstat):
-                        syllstat[stat] = list()
-                        for a in range(len(partstat[stat])):
-                            syllstat[stat].append(0)
-                    for a in range(len(partstat[stat])):
-                        syllstat[stat][a] += partstat[stat][a]
-                part.pop("long_syllable_statistics")
-            if("stressed_syllable_statistics" in part):
-                partstat = part["stressed_syllable_statistics"]
-                for stat in partstat.keys():
-                    if(stat not in stressstat):
-                        stressstat[stat] = list()
-                        for a in range(len(partstat[stat])):
-                            stressstat[stat].append(0)
-                    for a in range(len(partstat[stat])):
-                        stressstat[stat][a] += partstat[stat][a]
-                part.pop("stressed_syllable_statistics")
-            if("wordstat" in part):
-                partstat = part["wordstat"]
-                for stat in partstat.keys():
-                    if(stat not in wordstat):
-                        wordstat[stat] = 0
-                    wordstat[stat] += partstat[stat]
-                wordstat["_vocabulary"] = wordstat["_vocabulary"] / len(text["parts"])
-                wordstat["_repetitivity"] = wordstat["_repetitivity"] / len(text["parts"])
-                if(wordstat["_repetitivity"] == 0):
-                    print("Ajaj! " + str(len(text["parts"])))
-                part.pop("wordstat")
-            if("number_of_stanzas" in part):
-                stanzas += part["number_of_stanzas"]
-                part.pop("number_of_stanzas")
-            if("number_of_lines" in part):
-                lines += part["number_of_lines"]
-                part.pop("number_of_lines")
-            if("number_of_words" in part):
-                words += part["number_of_words"]
-                part.pop("number_of_words")
-    if(stanzas>0):
-        text["number_of_stanzas"] = stanzas
-    if(lines>0):
-        text["number_of_lines"] = lines
-    if(words>0):
-        text["number_of_words"] = words
-    if(len(syllstat)>0):
-        text["long_syllable_statistics"] = syllstat
-    if(len(stressstat)>0):
-        text["stressed_syllable_statistics"] = stressstat
-    if(len(wordstat)>0):
-        text["wordstat"] = wordstat
+            statistics.merge(Statistics.from_json(part, dict())) # The lemma frequencies are not stored in the poem.
+            for key in ["long_syllable_statistics", "stressed_syllable_statistics", "wordstat",
+                        "number_of_stanzas", "number_of_lines", "number_of_words"]:
+                if(key in part):
+                    part.pop(key)
+        statistics.to_json(text)
     return(text)
 
 
-def pdcdata(parameters, corpus):
-    """ Fills a JSON-compatible corpus with metadata from the PDC system. """
+def corpus_statistics(corpus):
+    """ Returns the statistics of a whole JSON-compatible corpus, merged from
+    those of its poems (see Statistics); the lemma frequencies of the corpus
+    are in lemma_frequencies. """
+    statistics = Statistics()
+    for poem in corpus:
+        statistics.merge(Statistics.from_json(poem))
+    return statistics
+
+
+""" The PDC fields of the metadata pdcdata() can add to the poems. """
+pdc_fields = { "date": "date", "incipit": "incipit", "sources": "sourcecat", "genre": "genre",
+               "metre": "metre", "acrostic": "acrostic", "colophon": "colophon", "place": "place" }
+
+def fetch_pdcdata(repository, poemids, fields, batch=500):
+    """ Fetches some fields of many poems from the PDC system, with one search
+    and one query for every batch of poem IDs.
+    Returns the values of the fields by poem ID and field. """
+    metadata = dict()
+    for first in range(0, len(poemids), batch):
+        poems = repository.searchm('poemid', poemids[first:first + batch])
+        for row in repository.show(['poemid'] + fields, poems):
+            metadata[row[1][0]] = { fields[a]: row[a + 2] for a in range(len(fields)) }
+    return metadata
+
+
+def pdcdata(parameters, corpus, repository=None, cache=None, batch=500):
+    """ Fills a JSON-compatible corpus with metadata from the PDC system
+    (or from the given repository). The metadata of all the poems are fetched
+    in batches first (see fetch_pdcdata()); with a cache, they are also
+    kept in that JSON file, and only the missing ones are fetched. """
+    if(repository is None):
+        repository = pdc_repository()
+    fields = [pdc_fields[parameter] for parameter in pdc_fields if parameter in parameters]
+    metadata = dict()
+    if(cache is not None and os.path.exists(cache)):
+        file = open(cache, "r")
+        metadata = json.loads(file.read())
+        file.close()
+    missing = []
+    for text in corpus:
+        poemid = text["poem_id"]
+        if(poemid not in missing and any(field not in metadata.get(poemid, dict()) for field in fields)):
+            missing.append(poemid)
+    if(len(missing) > 0 and len(fields) > 0):
+        for poemid, values in fetch_pdcdata(repository, missing, fields, batch).items():
+            metadata.setdefault(poemid, dict()).update(values)
+        if(cache is not None):
+            file = open(cache, "w")
+            file.write(json.dumps(metadata, ensure_ascii=False))
+            file.close()
 
     for text in corpus:
         poemid = text["poem_id"]
-        poem = rep.searchm('poemid', [poemid])
         print(poemid, end='')
+        if(poemid not in metadata):
+            print(" is not in the PDC system.")
+            continue
+        values = metadata[poemid]
         if('date' in parameters):
-            data = rep.show(['date'], poem)
-            text["poem_date"] = json.loads(data[0][1][0])["date"]
+            text["poem_date"] = json.loads(values["date"][0])["date"]
         if('incipit' in parameters):
-            text["poem_incipit"] = rep.show(['incipit'], poem)[0][1][0]
+            text["poem_incipit"] = values["incipit"][0]
         if('sources' in parameters):
-            text["poem_sources"] = rep.show(['sourcecat'], poem)[0][1]
+            text["poem_sources"] = values["sourcecat"]
             # print(text["sources"])
         if('genre' in parameters):
-            text["poem_genre"] = rep.show(['genre'], poem)[0][1]
+            text["poem_genre"] = values["genre"]
         if('metre' in parameters):
-            text["poem_metre"] = json.loads(rep.show(['metre'], poem)[0][1][0])["metre"]
+            text["poem_metre"] = json.loads(values["metre"][0])["metre"]
         if('acrostic' in parameters):
-            text["poem_acrostic"] = json.loads(rep.show(['acrostic'], poem)[0][1][0])["acrostic"]
+            text["poem_acrostic"] = json.loads(values["acrostic"][0])["acrostic"]
         if('colophon' in parameters):
-            text["poem_colophon"] = json.loads(rep.show(['colophon'], poem)[0][1][0])["colophon"]
+            text["poem_colophon"] = json.loads(values["colophon"][0])["colophon"]
         if('place' in parameters):
-            data = rep.show(['place'], poem)[0][1][0]
+            data = values["place"][0]
             if(len(data)>0):
                 text["poem_place"] = json.loads(data)["place"]
     return(corpus)
-        
+
 
 
 # def listmorph(morph, purelist):
@@ -559,36 +1816,53 @@ def pdcdata(parameters, corpus):
 #     return outlist
 
 
-def convert(text):
-    """ Converts between the emMorphOMH and Purepos formats. """
-    global unanalyzed
-    global unanalyzed_freq
-    global unanalyzed_pos
+noun_pattern = re.compile(r'[A-Za-zűáéúőóüöíŰÁÉÚŐÓÜÖÍ]+\[[NQ]\]') # A noun (or quantitative) morpheme.
+tag_pattern = re.compile(r'\[(.*?)\]') # A tag, the group is the tag without the brackets.
+unanalyzed_pattern = re.compile(r'([^\t]+)\t.*')
+
+
+def convert(text, converted=None, context=None):
+    """ Converts between the emMorphOMH and Purepos formats.
+    converted may be a dictionary remembering the conversion of each word's analyses.
+    The unanalyzed words are collected in the context (and logged in its diagnostics). """
+    if(context is None):
+        context = default_context
+    unanalyzed = context.unanalyzed
+    unanalyzed_freq = context.unanalyzed_freq
+    unanalyzed_pos = context.unanalyzed_pos
+    diagnostics = context.diagnostics
     word = text.split('\n\n')
-    out = ''
+    out = []
     space = False
     wcount = 0
     unanalyzed_pos.clear()
     for w in word:
         if('[EOS]' in w): # EOS if every stanza is a sentence, EOL if every line is a sentence.
-            out = out + '\n'
+            out.append('\n')
             space = False
         elif('[EOL]' not in w): # inverse! EOL if every stanza is a sentence, EOS if every line is a sentence.
             if(space == True):
-                out += ' '
+                out.append(' ')
             else:
                 space = True
-            out += mconv(w)
+            if(converted is None):
+                out.append(mconv(w))
+            else:
+                if(w not in converted):
+                    converted[w] = mconv(w)
+                out.append(converted[w])
             wcount += 1
         if('+?' in w and w[0:5] not in ['[EOL]', '[EOS]']):
-            ua = re.sub(r'([^\t]+)\t.*', r'\1', w)
+            ua = unanalyzed_pattern.sub(r'\1', w)
             unanalyzed.add(ua)
             unanalyzed_pos.append(wcount)
             if(ua in unanalyzed_freq):
                 unanalyzed_freq[ua] += 1
             else:
                 unanalyzed_freq[ua] = 1
-    return out
+            if(diagnostics is not None and ua.strip() not in ['[EOL]', '[EOS]']):
+                diagnostics.unanalyzed(ua.strip())
+    return ''.join(out)
 
 
 def mconv(w):
@@ -601,107 +1875,384 @@ def mconv(w):
         column = row.split('\t')
         if(len(column)==3):
             orig = column[0]
-            if('+?' in column[1]):
-                chain = ''
-            else:
-                nounlist = re.findall('[A-Za-zűáéúőóüöíŰÁÉÚŐÓÜÖÍ]+\[[NQ]\]', column[1]) # List of noun (and quantitative) morphemes in the word
-                # derivlist = re.findall('[A-Za-zűáéúőóüöíŰÁÉÚŐÓÜÖÍ]+\[_', column[1]) # List of derivational suffixes in the word
-                if('[VPfx]' in column[1]):
-                    vpfx = re.sub(r'(.*)(\[VPfx\])(?!.*\2)(.*)', r'\1', column[1]) # Everything before the last [VPfx] tag.
-                    vpfx = re.sub(r'\[.*?\]', r'', vpfx) # Only the text without tags: this is the verbal prefix.
-                    verb = re.sub(r'(.*)(\[VPfx\])(?!.*\2)(.*)', r'\3', column[1]).split('[')[0] # This is the radical of the verb.
-                    chain = vpfx + verb # This is the verb with all the prefixes (like "el-kihirdet" in case of "el-kihirdetteték"): the lemma.
-                    # chain = column[1].split('[VPfx]')[0] + column[1].split('[VPfx]')[1].split('[')[0] # This one could not handle multiple prefixes.
-                elif(len(nounlist)>1):
-                    chain = ''
-                    for noun in nounlist:
-                        chain += re.sub(r'([A-Za-zűáéúőóüöíŰÁÉÚŐÓÜÖÍ]+)\[[NQ]\]', r'\1', noun)
-                else:
-                    chain = column[1].split('[')[0] # The lemma is before the first bracket.
-                # if(len(derivlist)>0): # The lemma has to contain the derivative suffixes.
-                #     first = True
-                #     if('[V]' in column[1] and chain[-2:] == 'ik'): # handling the so-called "ikes igék" problem
-                #         chain = chain[0:-2]
-                #     print(chain + ' -> ', end='')
-                #     for morpheme in re.findall(r'[^\[\]]+\[[^\]]+\]', column[1]):
-                #         mo = re.sub(r'([^\[\]]+)\[([^\]]+)\]', r'\1', morpheme)
-                #         an = re.sub(r'([^\[\]]+)\[([^\]]+)\]', r'\2', morpheme)
-                #         if(first == True):
-                #             first = False
-                #         else:
-                #             if('Adj' not in an and 'Adv' not in an and '_' not in an and an not in ['N', 'Q', 'V']):
-                #                 chain += mo
-                #             else:
-                #                 chain += mo
-                #                 break
-                #     print(chain)
-                chaincat = re.findall(r'\[.*?\]', column[1]) # All the tags in one list.
-                for cat in range(len(chaincat)):
-                    chaincat[cat] = re.sub(r'\[(.*?)\]', '\\1', chaincat[cat]) # Clearing the brackets of the tags.
-                chain = chain + '[' + ':'.join(chaincat) + ']' # The chain of morphological categories separated by :.
-            ppos.append(chain)
-    out = orig
+            ppos.append(mconv_analysis(column[1]))
     if(len(ppos)>0 and len(ppos[0])>0):
-        out = out + '{{' + '||'.join(ppos) + '}}' # All the possible analyses separated with ||.
-    return out
+        return orig + '{{' + '||'.join(ppos) + '}}' # All the possible analyses separated with ||.
+    return orig
+
+
+def mconv_analysis(analysis):
+    """ Converts one analysis of emMorphOMH to a Purepos candidate:
+    the lemma followed by the morphological categories separated by :. """
+    if('+?' in analysis):
+        return ''
+    last = analysis.rfind('[VPfx]')
+    if(last >= 0):
+        vpfx = tag_pattern.sub('', analysis[:last]) # Only the text before the last [VPfx] tag, without tags: this is the verbal prefix.
+        verb = analysis[last + 6:].split('[')[0] # This is the radical of the verb.
+        chain = vpfx + verb # This is the verb with all the prefixes (like "el-kihirdet" in case of "el-kihirdetteték"): the lemma.
+    else:
+        nounlist = noun_pattern.findall(analysis) # List of noun (and quantitative) morphemes in the word
+        if(len(nounlist)>1):
+            chain = ''.join([noun[:-3] for noun in nounlist]) # The nouns without their [N] or [Q] tags.
+        else:
+            chain = analysis.split('[')[0] # The lemma is before the first bracket.
+    return chain + '[' + ':'.join(tag_pattern.findall(analysis)) + ']' # The chain of morphological categories separated by :.
 
 
-def linesearch(pattern, corpus):
-    """ Searches for a pattern in the lines of a JSON-compatible corpus.
-    Returns the number of hits. """
+def poem_lines(poem):
+    """ Returns the texts of the lines of a JSON-compatible poem. """
+    lines = []
+    for unit in poem_units(poem):
+        for stanza in unit.get("stanzas", []):
+            for line in stanza.get("lines", []):
+                if("line_text" in line):
+                    lines.append(line["line_text"])
+    return lines
+
+
+def linesearch(pattern, corpus, verbose=True):
+    """ Searches for a pattern in the lines of a JSON-compatible corpus
+    (or of a LineIndex, which only looks at the lines that can match).
+    Returns the number of hits, and the lines with a hit by poem.
+    With verbose, the hits are printed. """
     """ Would be nice if I could give this function another function name as an argument, that it should call if there is a hit. """
-    print("Searching for '" + pattern + "'.")
+    if(verbose):
+        print("Searching for '" + pattern + "'.")
+    if(isinstance(corpus, LineIndex)):
+        lines = corpus.candidates(pattern)
+    else:
+        lines = [[poem.get("poem_id"), poem_lines(poem)] for poem in corpus]
+    compiled = re.compile(pattern)
     hits = dict()
     hits["hits"] = 0
     hits["poems"] = dict()
-    for poem in corpus:
+    for poemid, texts in lines:
         hitpoem = 0
         linelist = []
-        if("parts" in poem):
-            for part in poem["parts"]:
-                for stanza in part["stanzas"]:
-                    for line in stanza["lines"]:
-                        if("line_text" in line):
-                            hitline = len(re.findall(pattern, line["line_text"]))
-                            if(hitline > 0):
-                                linelist.append(line["line_text"])
-                                hitpoem += hitline
-        else:
-            for stanza in poem["stanzas"]:
-                for line in stanza["lines"]:
-                    if("line_text" in line):
-                        hitline = len(re.findall(pattern, line["line_text"]))
-                        if(hitline > 0):
-                            linelist.append(line["line_text"])
-                            hitpoem += hitline
+        for text in texts:
+            hitline = len(compiled.findall(text))
+            if(hitline > 0):
+                linelist.append(text)
+                hitpoem += hitline
         hits["hits"] += hitpoem
         if(hitpoem > 0):
-            print(poem["poem_id"] + ": " + str(hitpoem))
-            hits["poems"][poem["poem_id"]] = linelist
-            print('\n'.join(linelist))
-    print("----------\nTotal hits: " + str(hits["hits"]) + '\n')
+            hits["poems"][poemid] = linelist
+            if(verbose):
+                print(poemid + ": " + str(hitpoem))
+                print('\n'.join(linelist))
+    if(verbose):
+        print("----------\nTotal hits: " + str(hits["hits"]) + '\n')
     return(hits)
 
 
-def download_corpus(repertory, idlist):
-    """ Downloads a list of poems from the PDC system.
+def literal_requirements(parsed):
+    """ Returns what every match of a parsed regular expression contains:
+    a list of literal strings and of alternatives (lists of such lists). """
+    requirements = []
+    literal = ''
+    for op, av in parsed:
+        if(op == sre_parse.LITERAL):
+            literal += chr(av)
+            continue
+        if(len(literal) > 0):
+            requirements.append(literal)
+            literal = ''
+        if(op == sre_parse.SUBPATTERN):
+            requirements.extend(literal_requirements(av[-1]))
+        elif(op in [sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)] and av[0] >= 1):
+            requirements.extend(literal_requirements(av[2]))
+        elif(op == sre_parse.BRANCH):
+            requirements.append([literal_requirements(alternative) for alternative in av[1]])
+    if(len(literal) > 0):
+        requirements.append(literal)
+    return requirements
+
+
+dotless_i = { ord('ı'): 'i', ord('İ'): 'i' } # Matched by 'i' in the case-insensitive patterns.
+
+class LineIndex:
+    """ Trigram index of the lines of a corpus for linesearch().
+    The lines are normalized with str.casefold() (and with 'ı' and 'İ' folded
+    into 'i', since re ignores the case of these the same way), and every trigram points to
+    the set of lines that contain it. A regular expression is only matched
+    against the lines that contain every trigram of the literals it requires
+    (see literal_requirements()).
+    Poems can be added, replaced (update()) or removed one by one,
+    and the index can be saved into a JSON file and loaded back. """
+
+    def __init__(self, corpus=None):
+        self.lines = [] # [poem_id, line_text] by line number, None for the removed lines.
+        self.poems = dict() # The line numbers of each poem.
+        self.rank = dict() # The place of each poem in the corpus.
+        self.postings = dict() # The line numbers of each trigram.
+        if(corpus is not None):
+            for poem in corpus:
+                self.update(poem)
+
+    def trigrams(self, text):
+        text = text.translate(dotless_i).casefold()
+        return set([text[a:a + 3] for a in range(len(text) - 2)])
+
+    def update(self, poem):
+        """ Adds a poem to the index, or replaces the poem with the same poem_id. """
+        poemid = poem["poem_id"]
+        self.remove(poemid)
+        if(poemid not in self.rank):
+            self.rank[poemid] = len(self.rank)
+        numbers = []
+        for text in poem_lines(poem):
+            line = len(self.lines)
+            self.lines.append([poemid, text])
+            numbers.append(line)
+            for trigram in self.trigrams(text):
+                if(trigram not in self.postings):
+                    self.postings[trigram] = set()
+                self.postings[trigram].add(line)
+        self.poems[poemid] = numbers
+
+    def remove(self, poemid):
+        """ Removes a poem from the index (it keeps its place in the corpus if it comes back). """
+        if(poemid in self.poems):
+            for line in self.poems.pop(poemid):
+                for trigram in self.trigrams(self.lines[line][1]):
+                    self.postings[trigram].discard(line)
+                    if(len(self.postings[trigram]) == 0):
+                        self.postings.pop(trigram)
+                self.lines[line] = None
+
+    def narrow(self, requirements):
+        """ Returns the line numbers that satisfy the requirements
+        (see literal_requirements()), or None if any line can. """
+        result = None
+        for requirement in requirements:
+            if(type(requirement) is str):
+                for trigram in self.trigrams(requirement):
+                    lines = self.postings.get(trigram, set())
+                    result = lines if result is None else result & lines
+            else:
+                union = set()
+                for alternative in requirement:
+                    lines = self.narrow(alternative)
+                    if(lines is None):
+                        union = None
+                        break
+                    union |= lines
+                if(union is not None):
+                    result = union if result is None else result & union
+        return result
+
+    def candidates(self, pattern):
+        """ Returns the lines that can match a pattern, as [poem_id, line texts]
+        pairs in the order of the corpus. """
+        lines = self.narrow(literal_requirements(sre_parse.parse(pattern)))
+        if(lines is None):
+            lines = [line for numbers in self.poems.values() for line in numbers]
+        bypoem = dict()
+        for line in sorted(lines):
+            poemid, text = self.lines[line]
+            if(poemid not in bypoem):
+                bypoem[poemid] = []
+            bypoem[poemid].append(text)
+        return [[poemid, bypoem[poemid]] for poemid in sorted(bypoem, key=lambda poemid: self.rank[poemid])]
+
+    def search(self, pattern):
+        """ Searches for a pattern like linesearch(), without printing. """
+        return linesearch(pattern, self, False)
+
+    def save(self, location):
+        """ Writes the lines of the index into a JSON file. """
+        lines = dict()
+        for poemid in sorted(self.rank, key=lambda poemid: self.rank[poemid]):
+            if(poemid in self.poems):
+                lines[poemid] = [self.lines[line][1] for line in self.poems[poemid]]
+        file = open(location, "w")
+        file.write(json.dumps({ "rank": self.rank, "lines": lines }, ensure_ascii=False))
+        file.close()
+
+    @classmethod
+    def load(cls, location):
+        """ Loads an index saved by save(). """
+        file = open(location, "r")
+        stored = json.loads(file.read())
+        file.close()
+        index = cls()
+        index.rank = stored["rank"]
+        for poemid in stored["lines"]:
+            index.update({ "poem_id": poemid, "stanzas": [{ "lines": [{ "line_text": text } for text in stored["lines"][poemid]] }] })
+        return index
+
+
+class Concordance:
+    """ Concordance of the lemmas and the morphological tags of an analyzed
+    corpus (see analyze_morph()), built on a TokenStore. Every word with a
+    text is an occurrence, identified by its position in the word arrays
+    of the store; its coordinates, text, lemma, morphology and line come
+    from the columns and the ranges of the store.
+    Every lemma and every tag (like 'Pl' in '[N][Pl][Acc]') has the ordered
+    list of its occurrences, so find() only intersects these lists.
+    The concordance can be saved into a JSON file and loaded back. """
+
+    def __init__(self, corpus=None, store=None):
+        if(store is None):
+            store = TokenStore()
+        self.store = store
+        self.occurrences = array('l') # The words with a text.
+        self.lemmas = dict() # The occurrences of each lemma.
+        self.tags = dict() # The occurrences of each tag.
+        for a in range(len(store)):
+            self.add_words(store.word_range(a))
+        if(corpus is not None):
+            for poem in corpus:
+                self.add_poem(poem)
+
+    def add_words(self, words):
+        """ Adds the postings of a range of words of the store. """
+        strings = self.store.strings
+        columns = self.store.columns["word"]
+        for o in words:
+            if(columns["word_text"][o] == -1):
+                continue
+            self.occurrences.append(o)
+            if(columns["lemma"][o] != -1):
+                lemma = strings[columns["lemma"][o]]
+                if(lemma not in self.lemmas):
+                    self.lemmas[lemma] = array('l')
+                self.lemmas[lemma].append(o)
+            if(columns["morphology"][o] != -1):
+                for tag in set(tag_pattern.findall(strings[columns["morphology"][o]])):
+                    if(tag not in self.tags):
+                        self.tags[tag] = array('l')
+                    self.tags[tag].append(o)
+
+    def add_poem(self, poem):
+        """ Adds an analyzed poem to the store and its words to the postings. """
+        self.store.add_poem(poem)
+        self.add_words(self.store.word_range(len(self.store) - 1))
+
+    def __len__(self):
+        return len(self.occurrences)
+
+    def find(self, lemma=None, tags=None):
+        """ Returns the occurrences of a lemma, of the words with all the
+        given tags (like '[Pl][Acc]'), or of the lemma with the tags. """
+        postings = []
+        if(lemma is not None):
+            postings.append(self.lemmas.get(lemma, array('l')))
+        if(tags is not None):
+            for tag in tag_pattern.findall(tags):
+                postings.append(self.tags.get(tag, array('l')))
+        if(len(postings) == 0):
+            return list(self.occurrences)
+        postings.sort(key=len)
+        found = set(postings[0])
+        for posting in postings[1:]:
+            found.intersection_update(posting)
+        return sorted(found)
+
+    def string(self, level, key, a):
+        value = self.store.columns[level][key][a]
+        return self.store.strings[value] if value != -1 else None
+
+    def coordinates(self, o):
+        """ Returns the poem_id and the positions of the part (-1 without
+        parts), stanza, line and word of an occurrence. """
+        store = self.store
+        l = store.word_line[o]
+        s = store.line_stanza[l]
+        p = store.stanza_poem[s]
+        b = store.stanza_part[s]
+        if(b != -1):
+            first = store.part_stanzas[0][b]
+            b -= store.poem_parts[0][p]
+        elif(store.poem_parts[0][p] < store.poem_parts[1][p]):
+            first = store.part_stanzas[1][store.poem_parts[1][p] - 1]
+        else:
+            first = store.poem_stanzas[0][p]
+        return [self.string("poem", "poem_id", p) or '', b, s - first,
+                l - store.stanza_lines[0][s], o - store.line_words[0][l]]
+
+    def kwic(self, found, width=5):
+        """ Returns the occurrences in keyword-in-context form: the word
+        with at most width words of its line on both sides. """
+        store = self.store
+        text = store.columns["word"]["word_text"]
+        results = []
+        for o in found:
+            l = store.word_line[o]
+            words = [a for a in range(store.line_words[0][l], store.line_words[1][l]) if text[a] != -1]
+            w = words.index(o)
+            results.append({ "coordinates": self.coordinates(o),
+                            "left": ' '.join([store.strings[text[a]] for a in words[max(0, w - width):w]]),
+                            "word": store.strings[text[o]],
+                            "right": ' '.join([store.strings[text[a]] for a in words[w + 1:w + 1 + width]]),
+                            "lemma": self.string("word", "lemma", o),
+                            "morphology": self.string("word", "morphology", o),
+                            "line_text": self.string("line", "line_text", l) or '' })
+        return results
+
+    def save(self, location):
+        """ Writes the concordance (the corpus of the store and the postings)
+        into a JSON file. """
+        file = open(location, "w")
+        file.write(json.dumps({ "corpus": self.store.to_corpus(),
+                               "lemmas": { lemma: self.lemmas[lemma].tolist() for lemma in self.lemmas },
+                               "tags": { tag: self.tags[tag].tolist() for tag in self.tags } }, ensure_ascii=False))
+        file.close()
+
+    @classmethod
+    def load(cls, location):
+        """ Loads a concordance saved by save(). """
+        file = open(location, "r")
+        stored = json.loads(file.read())
+        file.close()
+        concordance = cls()
+        concordance.store = TokenStore.from_corpus(stored["corpus"])
+        text = concordance.store.columns["word"]["word_text"]
+        concordance.occurrences = array('l', [o for o in range(len(text)) if text[o] != -1])
+        concordance.lemmas = { lemma: array('l', stored["lemmas"][lemma]) for lemma in stored["lemmas"] }
+        concordance.tags = { tag: array('l', stored["tags"][tag]) for tag in stored["tags"] }
+        return concordance
+
+
+def iter_download_corpus(repertory, idlist, chunk=500, threads=1):
+    """ Downloads a list of poems from the PDC system chunk by chunk,
+    and yields them one by one as JSON-compatible poems, in the order of idlist.
+    The next chunks (threads of them) are downloaded in the background
+    while the current one is converted, so at most threads + 1 chunks
+    are in memory. With more than one thread, the repository is used
+    from several threads at once. With chunk <= 0 everything is
+    downloaded at once. """
+    idlist = list(idlist)
+    threads = max(threads, 1)
+    if(chunk <= 0):
+        chunk = max(len(idlist), 1)
+    chunks = [idlist[a:a + chunk] for a in range(0, len(idlist), chunk)]
+    fields = ['poemid','otkatxt','author','title', 'syllables']
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(threads) as pool:
+        downloads = [pool.submit(repertory.show, fields, ids) for ids in chunks[:threads]]
+        for a in range(len(chunks)):
+            download = downloads[a].result()
+            downloads[a] = None
+            if(len(downloads) < len(chunks)):
+                downloads.append(pool.submit(repertory.show, fields, chunks[len(downloads)]))
+            for poem in download:
+                if(len(poem[2][0])>0):
+                    print(poem[1][0])
+                    yield poemjson(poem[2][0], poem[1][0], poem[3][0], poem[4][0])
+
+
+def download_corpus(repertory, idlist, chunk=0, threads=1):
+    """ Downloads a list of poems from the PDC system
+    (in chunks, see iter_download_corpus()).
     Returns a list of JSON-compatible poems."""
-    download = repertory.show(['poemid','otkatxt','author','title', 'syllables'], idlist)
-    corpus = []
-    for poem in download:
-        if(len(poem[2][0])>0):
-            print(poem[1][0])
-            jpoem = poemjson(poem[2][0], poem[1][0], poem[3][0], poem[4][0])
-            corpus.append(jpoem)
-    return corpus
+    return list(iter_download_corpus(repertory, idlist, chunk, threads))
 
 
-def import_corpus(location):
-    """ Loads a list of poems from a directory
-    containing plain text files.
-    Returns a list of JSON-compatible poems.
-    Not yet ready at all."""
-    corpus = []
+def iter_import_corpus(location):
+    """ Yields the poems of a directory containing plain text files
+    one by one, as JSON-compatible poems. """
     # f = os.listdir()
     onlyfiles = [f for f in os.listdir(location) if os.path.isfile(os.path.join(location, f))==True]
     for poem in onlyfiles:
@@ -710,28 +2261,48 @@ def import_corpus(location):
             title = poem[:-4]
         else:
             title = poem
-        corpus.append(poemjson(file.read(), title, '', title))
+        text = file.read()
         file.close()
-    return corpus
+        yield poemjson(text, title, '', title)
 
 
-def load_corpus(location):
+def import_corpus(location):
     """ Loads a list of poems from a directory
-    containing JSON files.
-    Returns a list of JSON-compatible poems."""
-    corpus = []
+    containing plain text files.
+    Returns a list of JSON-compatible poems.
+    Not yet ready at all."""
+    return list(iter_import_corpus(location))
+
+
+def iter_load_corpus(location):
+    """ Yields the poems of a directory containing JSON files
+    (or of a CorpusFile) one by one. """
+    if(os.path.isfile(location)):
+        with CorpusFile(location, readonly=True) as corpusfile:
+            for poem in corpusfile:
+                yield poem
+        return
     # f = os.listdir()
     onlyfiles = [f for f in os.listdir(location) if os.path.isfile(os.path.join(location, f))==True]
     for poem in onlyfiles:
         file = open(location + '/' + poem, "r")
-        corpus.append(json.loads(file.read()))
+        text = file.read()
         file.close()
-    return corpus
+        yield json.loads(text)
+
+
+def load_corpus(location):
+    """ Loads a list of poems from a directory
+    containing JSON files.
+    Returns a list of JSON-compatible poems."""
+    return list(iter_load_corpus(location))
 
 
-def store_corpus(location, corpus):
+def store_corpus(location, corpus, atomic=False):
     """ Writes a list of poems in JSON format
-    to the specified directory. """
+    to the specified directory.
+    With atomic, every poem is written into a .tmp file first and moved
+    into place, so a crash never leaves a half-written poem file. """
     if not os.path.exists(location):
         os.makedirs(location)
     for poem in corpus:
@@ -740,82 +2311,560 @@ def store_corpus(location, corpus):
         poemid = 'UNKNOWN'
         if('poem_id' in poem):
             poemid = poem["poem_id"]
-        file = open(location + '/' + poemid + ".json", "w")
-        file.write(jsp)
-        file.close()
+        name = location + '/' + poemid + ".json"
+        if(atomic):
+            file = open(name + ".tmp", "w")
+            file.write(jsp)
+            file.close()
+            os.replace(name + ".tmp", name)
+        else:
+            file = open(name, "w")
+            file.write(jsp)
+            file.close()
 
 
-def analyze_corpus(analyze_list, corpus):
-    errlist = set([])
-    for poem in corpus:
-        """ Different normalization rules for Tinódi and other authors. """
-        author = ''
-        title = ''
-        poemid = ''
+class CorpusFile:
+    """ A corpus in a single file: one JSON poem per line (JSONL), with an
+    index of the position of every poem by its poem_id in the location + '.idx'
+    file. The poems can be iterated without loading the whole corpus,
+    and read, added or replaced one by one.
+    A replaced poem is appended to the end of the file and the index points
+    to the new version; compact() drops the old versions.
+    The index is written by flush() and close(); poems appended after the
+    last written index are found again when the file is opened.
+    With readonly=True the file is only read: it is not created, truncated
+    or changed, and the index file is not written. """
+
+    def __init__(self, location, readonly=False):
+        self.location = location
+        self.readonly = readonly
+        self.index = dict() # poem_id: [offset, length]
+        self.file = open(location, "rb" if readonly else "a+b")
+        self.size = 0 # The part of the file covered by the index.
+        if(os.path.exists(location + '.idx')):
+            file = open(location + '.idx', "r")
+            stored = json.loads(file.read())
+            file.close()
+            if(stored["size"] <= os.path.getsize(location)):
+                self.size = stored["size"]
+                for poemid, offset, length in stored["poems"]:
+                    self.index[poemid] = [offset, length]
+        self.scan()
+
+    def scan(self):
+        """ Indexes the poems after the indexed part of the file. """
+        self.file.seek(self.size)
+        offset = self.size
+        for line in self.file:
+            if(line.endswith(b'\n')):
+                self.index[self.poem_id(json.loads(line.decode('utf-8')))] = [offset, len(line)]
+                offset += len(line)
+        self.size = offset
+        if(not self.readonly):
+            self.file.truncate(offset) # An incomplete last line (from a crash) is dropped.
+
+    def poem_id(self, poem):
+        """ The key of a poem, like the file name in store_corpus(). """
         if('poem_id' in poem):
-            poemid = poem["poem_id"]
-        if('poem_author' in poem):
-            author = poem["poem_author"]
-        if('poem_title' in poem):
-            title = poem["poem_title"]
-        if('Tinódi' in author):
-            normalizator = 'tinodi'
+            return poem["poem_id"]
+        return 'UNKNOWN'
+
+    def flush(self, index=True):
+        """ Writes the data (and the index) to the disk. """
+        if(self.readonly):
+            return
+        self.file.flush()
+        if(not index):
+            return
+        file = open(self.location + '.idx.tmp', "w")
+        file.write(json.dumps({ "size": self.size, "poems": [[poemid] + self.index[poemid] for poemid in self.index] }, ensure_ascii=False))
+        file.close()
+        os.replace(self.location + '.idx.tmp', self.location + '.idx')
+
+    def close(self):
+        if(self.file is not None):
+            self.flush()
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, poemid):
+        return poemid in self.index
+
+    def ids(self):
+        """ Returns the poem_ids in the order of the corpus. """
+        return list(self.index.keys())
+
+    def get(self, poemid):
+        """ Returns the poem with the given poem_id. """
+        offset, length = self.index[poemid]
+        self.file.seek(offset)
+        return json.loads(self.file.read(length).decode('utf-8'))
+
+    def __getitem__(self, poemid):
+        return self.get(poemid)
+
+    def __iter__(self):
+        """ Yields the poems in the order of the corpus. """
+        for poemid in self.ids():
+            yield self.get(poemid)
+
+    def writable(self):
+        if(self.readonly):
+            raise RuntimeError(self.location + " is opened read-only.")
+
+    def add(self, poem):
+        """ Appends a poem, or replaces the poem with the same poem_id
+        (which keeps its place in the order of the corpus). """
+        self.writable()
+        line = (json.dumps(poem, ensure_ascii=False) + '\n').encode('utf-8')
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(line)
+        self.index[self.poem_id(poem)] = [self.size, len(line)]
+        self.size += len(line)
+
+    def extend(self, corpus):
+        for poem in corpus:
+            self.add(poem)
+
+    def compact(self):
+        """ Rewrites the file without the replaced versions of the poems. """
+        self.writable()
+        file = open(self.location + '.tmp', "wb")
+        index = dict()
+        offset = 0
+        for poemid in self.ids():
+            start, length = self.index[poemid]
+            self.file.seek(start)
+            file.write(self.file.read(length))
+            index[poemid] = [offset, length]
+            offset += length
+        file.close()
+        self.file.close()
+        os.replace(self.location + '.tmp', self.location)
+        self.file = open(self.location, "a+b")
+        self.index = index
+        self.size = offset
+        self.flush()
+
+
+def directory_to_corpusfile(directory, location):
+    """ Converts a directory of JSON files (see store_corpus())
+    into a CorpusFile, one poem at a time. """
+    with CorpusFile(location) as corpusfile:
+        for name in sorted(os.listdir(directory)):
+            if(os.path.isfile(os.path.join(directory, name))):
+                file = open(directory + '/' + name, "r")
+                corpusfile.add(json.loads(file.read()))
+                file.close()
+
+
+def corpusfile_to_directory(location, directory):
+    """ Converts a CorpusFile into a directory of JSON files
+    (see store_corpus()), one poem at a time. """
+    with CorpusFile(location, readonly=True) as corpusfile:
+        for poem in corpusfile:
+            store_corpus(directory, [poem])
+
+
+""" The analyzers analyze_corpus() runs in one traversal of each poem
+(after the morphology), in this order, with the names used in analyze_list. """
+registered_analyzers = [["syllables", SyllableAnalyzer],
+                        ["length", LengthAnalyzer],
+                        ["phonetic", PhoneticAnalyzer],
+                        ["wordstat", WordstatAnalyzer]]
+
+def register_analyzer(name, factory):
+    """ Makes a new analyzer available to analyze_corpus().
+    factory is called with the tools of the run and returns an Analyzer. """
+    registered_analyzers.append([name, factory])
+
+
+morphology_version = 1 # Raise it whenever the results of analyze_morph() change.
+
+def resources_fingerprint(locations, known=None):
+    """ Returns one SHA-1 hash of the contents of several files.
+    known holds the file_fingerprint() of the files already hashed. """
+    sha = hashlib.sha1()
+    for location in locations:
+        if(known is not None and location in known):
+            sha.update(known[location].split(':')[0].encode('utf-8'))
+        elif(os.path.exists(location)):
+            sha.update(file_fingerprint(location).split(':')[0].encode('utf-8'))
         else:
-            normalizator = 'historias'
-        print(poemid + '\t' + author + '\t' + title)
-        if("parts" in poem):
-            for part in poem["parts"]:
-                if('morphology' in analyze_list):
-                    pan = analyze_morph(part, normalizator)
-                    part = pan[0]
-                    errlist.update(pan[1])
-                if('syllables' in analyze_list):
-                    pan = analyze_syll(part)
-                    part = pan[0]
-                if('length' in analyze_list):
-                    pan = analyze_length(part)
-                    part = pan[0]
-                if('phonetic' in analyze_list):
-                    pan = analyze_phonetic(part)
-                    part = pan[0]
-                if('wordstat' in analyze_list):
-                    pan = analyze_wordstat(part)
-                    part = pan[0]
-            poem = sum_parts(poem)
-                # if('demo' in analyze_list): # Calling the demo function for parts, watch out for the other call!
-                #     dan = analyze_demo(part)
-                #     part = dan[0]
+            sha.update(b'missing')
+    return sha.hexdigest()
+
+
+normalizator_names = ['tinodi', 'historias'] # See poem_normalizator().
+
+def tools_fingerprint(hfst, purepos):
+    """ Returns one hash of the files of the morphological tools: the
+    transducer (hashed once with a MorphCache with a file) and PurePos. """
+    known = dict()
+    if(isinstance(hfst, MorphCache)):
+        hfst, cache = hfst.hfst, hfst
+        if(cache.fingerprint is not None):
+            known[hfst.transducer] = cache.fingerprint
+    return resources_fingerprint([hfst.transducer, purepos.jar, purepos.model], known)
+
+
+def morphology_fingerprint(hfst, purepos, normalizator, tools=None):
+    """ Identifies the code and the resources of the morphological analysis
+    with a normalizer: the normalizer's name and files, the transducer
+    and the PurePos model. tools is the tools_fingerprint(), if it is known. """
+    if(tools is None):
+        tools = tools_fingerprint(hfst, purepos)
+    return ('morphology:' + str(morphology_version) + ':' + normalizator + ':'
+            + resources_fingerprint(normalizer_resources(normalizator)) + ':' + tools)
+
+
+def analysis_fingerprints(analyze_list, names, analyzers, hfst, purepos):
+    """ Returns the fingerprint and the requirements of each analysis
+    of analyze_list, the morphology first, the others in the order they run.
+    The fingerprint of the morphology depends on the normalizer of the poem,
+    so it is a dictionary of the fingerprints by normalizer. """
+    fingerprints = dict()
+    if('morphology' in analyze_list):
+        tools = tools_fingerprint(hfst, purepos) # The large files are hashed once.
+        fingerprints["morphology"] = [{ normalizator: morphology_fingerprint(hfst, purepos, normalizator, tools)
+                                       for normalizator in normalizator_names }, []]
+    for a in range(len(analyzers)):
+        fingerprints[names[a]] = [analyzers[a].fingerprint(), analyzers[a].requires]
+    return fingerprints
+
+
+def poem_units(poem):
+    """ Returns the parts of a poem, or the poem itself if it has none. """
+    if("parts" in poem):
+        return poem["parts"]
+    return [poem]
+
+
+def content_hash(text):
+    """ Returns the SHA-1 hash of the lines and words of a JSON-compatible poem (or part). """
+    content = []
+    for stanza in text.get("stanzas", []):
+        for line in stanza.get("lines", []):
+            content.append([line.get("line_text"), [word.get("word_text") for word in line.get("words", [])]])
+        content.append(None)
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def analysis_plan(poem, fingerprints):
+    """ Finds the analyses whose results stored in a poem are out of date.
+    The signature of an analysis of a part (or of the poem without parts)
+    is the hash of its text, of the fingerprint of the analysis and of the
+    signatures of the analyses it requires; the signatures are stored in the
+    part by the incremental runs, under "analysis_signatures".
+    Returns [new signatures, out-of-date analyses] for each part. """
+    plan = []
+    normalizator = poem_normalizator(poem)
+    for unit in poem_units(poem):
+        content = content_hash(unit)
+        stored = unit.get("analysis_signatures", dict())
+        signatures = dict(stored)
+        stale = set()
+        for name in fingerprints:
+            fingerprint, requires = fingerprints[name]
+            if(type(fingerprint) is dict):
+                fingerprint = fingerprint[normalizator]
+            signature = content + fingerprint + ''.join([signatures.get(required, '') for required in requires])
+            signatures[name] = hashlib.sha1(signature.encode('utf-8')).hexdigest()
+            if(stored.get(name) != signatures[name]):
+                stale.add(name)
+        plan.append([signatures, stale])
+    return plan
+
+
+def clear_morph(text):
+    """ Removes the results of an earlier morphological analysis from a JSON-compatible poem. """
+    for stanza in text.get("stanzas", []):
+        for line in stanza.get("lines", []):
+            for word in line.get("words", []):
+                for key in ["lemma", "morphology", "morphology_guessed"]:
+                    if(key in word):
+                        word.pop(key)
+
+
+def reanalyze_poem(poem, analyzers, names, plan, metrics=None):
+    """ Runs the analyzers whose results are out of date on a JSON-compatible
+    poem (see analysis_plan()), and stores the new signatures.
+    Analyzers with independent parts run on the changed parts only,
+    the others on every part, as their results are summed. """
+    units = poem_units(poem)
+    whole = set()
+    for signatures, stale in plan:
+        whole.update(stale)
+    for u in range(len(units)):
+        selected = [analyzers[a] for a in range(len(analyzers))
+                    if names[a] in plan[u][1] or (names[a] in whole and not analyzers[a].independent_parts)]
+        if(len(selected) > 0):
+            run_analyzers(units[u], selected, metrics)
+    if("parts" in poem):
+        sum_parts(poem)
+    for u in range(len(units)):
+        units[u]["analysis_signatures"] = plan[u][0]
+    return poem
+
+
+def poem_normalizator(poem):
+    """ Different normalization rules for Tinódi and other authors. """
+    if('poem_author' in poem and 'Tinódi' in poem["poem_author"]):
+        return 'tinodi'
+    return 'historias'
+
+
+def analyze_corpus(analyze_list, corpus, ipacache="ipacache.db", morphcache="morphcache.db", batch=100, processes=1, context=None, incremental=False, quiet=False, metrics_file=None, diagnostics=None):
+    """ Runs the analyses in analyze_list on every poem of a corpus.
+    With batch > 0 the morphology of that many poems at a time
+    (all their parts included) is analyzed in one hfst and PurePos pass.
+    The IPA transcriptions and the hfst analyses are cached in the
+    ipacache and morphcache files (in memory only if they are None).
+    With processes > 1 the corpus is shared between that many worker
+    processes (see analyze_parallel()).
+    With incremental, a corpus analyzed earlier (by an incremental run,
+    see store_corpus() and load_corpus()) is only analyzed again where
+    its text, the analyzers or their resources changed (see analysis_plan()).
+    The statistics and the metrics of the run are collected in the context;
+    with quiet, the progress messages are not printed, and the metrics
+    of this run alone are written into the metrics_file (see RunMetrics.write()).
+    The PurePos errors, the unanalyzed forms and the guessed normalizations
+    are logged as the run goes in the diagnostics (a Diagnostics, by default
+    the diagnostics.jsonl file of the run's directory), and their summary is
+    written into errors.csv, unanalyzed.csv and normalizations.csv at the end. """
+    if(context is None):
+        context = default_context
+    if(processes > 1):
+        if(diagnostics is None):
+            diagnostics = Diagnostics(context.path("diagnostics.jsonl"))
+        context.statistics = Statistics() # Of the poems of this run, merged from the workers.
+        outer_metrics = context.metrics
+        context.metrics = RunMetrics(outer_metrics.quiet or quiet) # Of this run only.
+        try:
+            analyze_parallel(analyze_list, corpus, processes, context,
+                             { "ipacache": ipacache, "morphcache": morphcache, "batch": batch, "incremental": incremental,
+                              "quiet": quiet, "diagnostics": diagnostics })
+        finally:
+            run_metrics = context.metrics
+            context.metrics = outer_metrics.merge(run_metrics)
+        diagnostics.export(context.workdir)
+        if(metrics_file is not None):
+            run_metrics.write(metrics_file)
+        return corpus
+    for poem in iter_analyze_corpus(analyze_list, corpus, ipacache, morphcache, batch, context, incremental, quiet, metrics_file, diagnostics):
+        pass
+    return corpus
+
+
+def iter_analyze_corpus(analyze_list, poems, ipacache="ipacache.db", morphcache="morphcache.db", batch=100, context=None, incremental=False, quiet=False, metrics_file=None, diagnostics=None):
+    """ Runs the analyses in analyze_list on the poems of an iterable
+    (a list or a generator like iter_load_corpus()) like analyze_corpus()
+    does, and yields each poem as soon as it is analyzed.
+    Only one batch of poems is kept in memory at a time.
+    The external tools are closed when the poems run out
+    (or when the generator is closed), and the metrics of the run (recorded
+    apart, then added to those of the context) and the summary of the
+    diagnostics are written then. With a Diagnostics given,
+    the records are logged into it, but no summary is written. """
+    if(context is None):
+        context = default_context
+    export = diagnostics is None
+    if(export):
+        diagnostics = Diagnostics(context.path("diagnostics.jsonl"))
+    outer_diagnostics = context.diagnostics
+    context.diagnostics = diagnostics
+    context.statistics = Statistics() # Of the poems of this run.
+    outer_metrics = context.metrics
+    run_metrics = RunMetrics(outer_metrics.quiet or quiet)
+    context.metrics = run_metrics # Used by analyze_morph() and the others during the run.
+    start = time.perf_counter()
+    errlist = context.errors
+    espeak = None
+    hfst = None
+    purepos = None
+    if('morphology' in analyze_list):
+        hfst = MorphCache(HfstSession(metrics=run_metrics), morphcache) # The transducer is loaded once for the whole run.
+        purepos = PurePosSession(metrics=run_metrics) # And so is the PurePos model.
+    if('phonetic' in analyze_list):
+        if(ipacache is not None):
+            espeak = IPACache(ipacache, metrics=run_metrics) # Starts eSpeak only for unseen words.
+        else:
+            espeak = EspeakWorker(metrics=run_metrics) # One eSpeak process for the whole run.
+    tools = { "espeak": espeak, "hfst": hfst, "purepos": purepos, "metrics": run_metrics }
+    names = [name for name, factory in registered_analyzers if name in analyze_list]
+    analyzers = [factory(tools) for name, factory in registered_analyzers if name in analyze_list]
+    wordstat = None # Counts the lemma frequencies of the statistics during the traversal.
+    for analyzer in analyzers:
+        if(isinstance(analyzer, WordstatAnalyzer)):
+            wordstat = analyzer
+    fingerprints = None
+    if(incremental):
+        fingerprints = analysis_fingerprints(analyze_list, names, analyzers, hfst, purepos)
+    reanalyzed = 0
+    total = 0
+    chunk = batch if batch > 0 else 1
+    source = iter(poems)
+    try:
+        while(True):
+            poems = list(islice(source, chunk))
+            if(len(poems) == 0):
+                break
+            total += len(poems)
+            plans = [None for poem in poems]
+            if(incremental):
+                plans = [analysis_plan(poem, fingerprints) for poem in poems]
+            morphunits = [] # The parts (or poems) to analyze, with their normalizators.
+            for p in range(len(poems)):
+                units = poem_units(poems[p])
+                for u in range(len(units)):
+                    if('morphology' in analyze_list and (plans[p] is None or 'morphology' in plans[p][u][1])):
+                        if(plans[p] is not None):
+                            clear_morph(units[u])
+                        morphunits.append([units[u], poem_normalizator(poems[p])])
+            batched = 'morphology' in analyze_list and batch > 0
+            if(batched):
+                with run_metrics.timed("stage.morphology"):
+                    errlist.update(analyze_morph_batch(morphunits, hfst, purepos, context))
+            for p in range(len(poems)):
+                poem = poems[p]
+                run_metrics.count("poems")
+                if(plans[p] is not None and all(len(stale) == 0 for signatures, stale in plans[p])):
+                    context.statistics.merge(Statistics.from_json(poem))
+                    run_metrics.count("poems.unchanged")
+                    yield poem # Nothing changed.
+                    continue
+                author = ''
+                title = ''
+                poemid = ''
+                if('poem_id' in poem):
+                    poemid = poem["poem_id"]
+                if('poem_author' in poem):
+                    author = poem["poem_author"]
+                if('poem_title' in poem):
+                    title = poem["poem_title"]
+                normalizator = poem_normalizator(poem)
+                run_metrics.say(poemid + '\t' + author + '\t' + title)
+                run_metrics.count("words", sum([len(line.get("words", [])) for unit in poem_units(poem)
+                                                for stanza in unit.get("stanzas", []) for line in stanza.get("lines", [])]))
+                if('morphology' in analyze_list and not batched):
+                    with run_metrics.timed("stage.morphology"):
+                        for unit in poem_units(poem):
+                            if(any(unit is morphunit[0] for morphunit in morphunits)):
+                                pan = analyze_morph(unit, normalizator, hfst, purepos, context)
+                                errlist.update(pan[1])
+                with run_metrics.timed("stage.analyzers"):
+                    if(plans[p] is None):
+                        analyze_poem(poem, analyzers, run_metrics)
+                    else:
+                        reanalyze_poem(poem, analyzers, names, plans[p], run_metrics)
+                frequencies = None
+                if(wordstat is not None):
+                    frequencies = wordstat.take_frequencies() # None if the wordstat was up to date.
+                context.statistics.merge(Statistics.from_json(poem, frequencies))
+                reanalyzed += 1
+                yield poem
+        if(incremental):
+            run_metrics.say("Analyzed " + str(reanalyzed) + " of " + str(total) + " poems.")
+    finally:
+        if(hfst is not None):
+            run_metrics.say("Morphology cache: " + json.dumps(hfst.statistics()))
+            run_metrics.count("cache.morphology.hits", hfst.hits)
+            run_metrics.count("cache.morphology.misses", hfst.misses)
+            run_metrics.count("cache.morphology.new_forms", hfst.new_forms)
+            hfst.close()
+        if(purepos is not None):
+            purepos.close()
+        if(espeak is not None):
+            if(isinstance(espeak, IPACache)):
+                run_metrics.say("IPA cache: " + json.dumps(espeak.statistics()))
+                run_metrics.count("cache.ipa.memory_hits", espeak.hits)
+                run_metrics.count("cache.ipa.disk_hits", espeak.disk_hits)
+                run_metrics.count("cache.ipa.misses", espeak.misses)
+                run_metrics.count("cache.ipa.new_forms", espeak.new_forms)
+            espeak.close()
+        context.diagnostics = outer_diagnostics
+        if(export):
+            diagnostics.export(context.workdir)
         else:
-            if('morphology' in analyze_list):
-                pan = analyze_morph(poem, normalizator)
-                poem = pan[0]
-                errlist.update(pan[1])
-            if('syllables' in analyze_list):
-                pan = analyze_syll(poem)
-                poem = pan[0]
-            if('length' in analyze_list):
-                pan = analyze_length(poem)
-                poem = pan[0]
-            if('phonetic' in analyze_list):
-                pan = analyze_phonetic(poem)
-                poem = pan[0]
-            if('wordstat' in analyze_list):
-                pan = analyze_wordstat(poem)
-                poem = pan[0]
-            # if('demo' in analyze_list): # Calling the demo function for poems.
-            #     dan = analyze_demo(poem)
-            #     poem = dan[0]
-        # if('syllables' in analyze_list):
-        #     if(11 in poem["long_syllable_statistics"]):
-        #         for a in poem["long_syllable_statistics"][11]:
-        #             print(a, end='\t')
-        #         print('')
-        # if('length' in analyze_list):
-        #     print(str(poem["number_of_stanzas"]) + '\t' + str(poem["number_of_lines"]) + '\t' + str(poem["number_of_words"]))
-        errfile = open("errors.csv", "w")
-        for err in errlist:
-            errfile.write(err + '\n')
-        errfile.close()
+            diagnostics.flush()
+        run_metrics.add_time("run", time.perf_counter() - start)
+        context.metrics = outer_metrics.merge(run_metrics)
+        if(metrics_file is not None):
+            run_metrics.write(metrics_file)
+
+
+def analyze_stream(analyze_list, poems, target, resume=True, **options):
+    """ Analyzes the poems of an iterable (see iter_load_corpus()) one batch
+    at a time and writes each poem into the target (a CorpusFile or
+    a directory, see store_corpus()) as soon as it is analyzed.
+    With resume, the poems already in the target are skipped, so an
+    interrupted run goes on after the last poem written.
+    The options are passed to iter_analyze_corpus().
+    Returns the number of poems written. """
+    if(isinstance(target, CorpusFile)):
+        done = lambda poemid: poemid in target
+    else:
+        done = lambda poemid: os.path.exists(target + '/' + poemid + ".json")
+    if(resume):
+        poems = (poem for poem in poems if not done(poem.get("poem_id", 'UNKNOWN')))
+    written = 0
+    for poem in iter_analyze_corpus(analyze_list, poems, **options):
+        if(isinstance(target, CorpusFile)):
+            target.add(poem)
+            target.flush(index=False) # Found again by a CorpusFile opened after a crash.
+        else:
+            store_corpus(target, [poem], atomic=True) # Never half-written, so never skipped as done.
+        written += 1
+    return written
+
+
+def analyze_worker(task):
+    """ Analyzes a chunk of a corpus in a worker process,
+    with its own context and temporary directory.
+    Returns the analyzed poems and the context. """
+    import tempfile
+    analyze_list, poems, options = task
+    context = AnalysisContext(tempfile.mkdtemp(prefix="anac-"))
+    try:
+        analyze_corpus(analyze_list, poems, context=context, **options)
+    finally:
+        shutil.rmtree(context.workdir, ignore_errors=True)
+    context.workdir = '.'
+    return [poems, context]
+
+
+def analyze_parallel(analyze_list, corpus, processes, context, options):
+    """ Shares a corpus between worker processes in contiguous chunks,
+    one per process, so that every worker starts its external tools once.
+    The poems keep their order, and the statistics of the workers are
+    merged into the context in corpus order. The workers log their
+    diagnostics into the Diagnostics of the options. The "run" timer of the workers
+    is kept as "run.workers", and "run" holds the wall time of the whole run. """
+    start = time.perf_counter()
+    if(len(corpus) == 0):
+        return corpus
+    import multiprocessing
+    size = -(-len(corpus) // processes)
+    tasks = [[analyze_list, corpus[a:a + size], options] for a in range(0, len(corpus), size)]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(analyze_worker, tasks)
+    analyzed = []
+    for poems, worker in results:
+        analyzed.extend(poems)
+        if("run" in worker.metrics.timers):
+            worker.metrics.timers["run.workers"] = worker.metrics.timers.pop("run")
+        context.merge(worker)
+    corpus[:] = analyzed
+    context.metrics.add_time("run", time.perf_counter() - start)
     return corpus
 
 def extract_text(corpus):
@@ -848,3 +2897,298 @@ def extract_text(corpus):
                 text += '\n'
         ctext.append(text)
     return(ctext)
+
+
+class TokenStore:
+    """ Compact, columnar representation of a JSON-compatible corpus.
+    Every level (poems, parts, stanzas, lines, words) is a set of typed
+    arrays: the word texts, lemmas, morphologies and the other frequent
+    strings as IDs into one string table, numbers as integers, and the
+    position of every record as the index of its parent and the range
+    of its children. Keys that have no column of their own are kept
+    per record, and the order of the keys of each record is remembered,
+    so to_corpus() gives back exactly the JSON it was built from. """
+
+    levels = ["poem", "part", "stanza", "line", "word"]
+    children = { "poem": ["parts", "stanzas"], "part": ["stanzas"], "stanza": ["lines"], "line": ["words"], "word": [] }
+    string_columns = { "poem": ["poem_id"],
+                      "part": [],
+                      "stanza": ["syllables"],
+                      "line": ["line_text", "stress_pattern", "metric_pattern"],
+                      "word": ["word_text", "word_text_normalized", "lemma", "morphology", "word_ipa_espeak"] }
+    int_columns = { "poem": [],
+                   "part": [],
+                   "stanza": ["stanza_number"],
+                   "line": ["line_number", "syllable_count", "stress_count"],
+                   "word": ["word_number", "syllable_count"] }
+
+    def __init__(self):
+        self.strings = [] # The string table.
+        self.string_ids = dict()
+        self.shapes = [] # The key orders of the records.
+        self.shape_ids = dict()
+        self.count = dict()
+        self.shape = dict()
+        self.other = dict() # Values without a column, per record (or None).
+        self.columns = dict()
+        for level in self.levels:
+            self.count[level] = 0
+            self.shape[level] = array('l')
+            self.other[level] = []
+            self.columns[level] = dict()
+            for key in self.string_columns[level] + self.int_columns[level]:
+                self.columns[level][key] = array('l') # -1 where the record has no such value.
+        # The parents of the records (-1 for the stanzas of poems without parts).
+        self.part_poem = array('l')
+        self.stanza_poem = array('l')
+        self.stanza_part = array('l')
+        self.line_stanza = array('l')
+        self.word_line = array('l')
+        # The ranges of the children: the first one and the one after the last one.
+        # The stanzas of a poem include the stanzas of its parts.
+        self.poem_parts = [array('l'), array('l')]
+        self.poem_stanzas = [array('l'), array('l')]
+        self.part_stanzas = [array('l'), array('l')]
+        self.stanza_lines = [array('l'), array('l')]
+        self.line_words = [array('l'), array('l')]
+
+    def string_id(self, text):
+        if(text not in self.string_ids):
+            self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return self.string_ids[text]
+
+    def shape_id(self, keys):
+        if(keys not in self.shape_ids):
+            self.shape_ids[keys] = len(self.shapes)
+            self.shapes.append(keys)
+        return self.shape_ids[keys]
+
+    def nested(self, level, record, key):
+        """ Tells whether a key of a record holds children stored in the arrays. """
+        return key in self.children[level] and type(record.get(key)) is list and all(type(child) is dict for child in record[key])
+
+    def add_record(self, level, record):
+        """ Stores the keys and the values (except the children) of a record. """
+        self.shape[level].append(self.shape_id(tuple(record.keys())))
+        for key in self.string_columns[level]:
+            value = record.get(key)
+            if(type(value) is str):
+                self.columns[level][key].append(self.string_id(value))
+            else:
+                self.columns[level][key].append(-1)
+        for key in self.int_columns[level]:
+            value = record.get(key)
+            if(type(value) is int):
+                self.columns[level][key].append(value)
+            else:
+                self.columns[level][key].append(-1)
+        other = None
+        for key in record:
+            if(self.nested(level, record, key)):
+                continue
+            if((key in self.string_columns[level] and type(record[key]) is str)
+               or (key in self.int_columns[level] and type(record[key]) is int)):
+                continue
+            if(other is None):
+                other = dict()
+            other[key] = record[key]
+        self.other[level].append(other)
+        self.count[level] += 1
+        return self.count[level] - 1
+
+    def add_stanzas(self, stanzas, poem, part):
+        for stanza in stanzas:
+            s = self.add_record("stanza", stanza)
+            self.stanza_poem.append(poem)
+            self.stanza_part.append(part)
+            self.stanza_lines[0].append(self.count["line"])
+            if(self.nested("stanza", stanza, "lines")):
+                for line in stanza["lines"]:
+                    l = self.add_record("line", line)
+                    self.line_stanza.append(s)
+                    self.line_words[0].append(self.count["word"])
+                    if(self.nested("line", line, "words")):
+                        for word in line["words"]:
+                            self.add_record("word", word)
+                            self.word_line.append(l)
+                    self.line_words[1].append(self.count["word"])
+            self.stanza_lines[1].append(self.count["line"])
+
+    def add_poem(self, poem):
+        """ Appends a JSON-compatible poem to the store. """
+        p = self.add_record("poem", poem)
+        self.poem_parts[0].append(self.count["part"])
+        self.poem_stanzas[0].append(self.count["stanza"])
+        if(self.nested("poem", poem, "parts")):
+            for part in poem["parts"]:
+                b = self.add_record("part", part)
+                self.part_poem.append(p)
+                self.part_stanzas[0].append(self.count["stanza"])
+                if(self.nested("part", part, "stanzas")):
+                    self.add_stanzas(part["stanzas"], p, b)
+                self.part_stanzas[1].append(self.count["stanza"])
+        self.poem_parts[1].append(self.count["part"])
+        if(self.nested("poem", poem, "stanzas")):
+            self.add_stanzas(poem["stanzas"], p, -1)
+        self.poem_stanzas[1].append(self.count["stanza"])
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """ Builds a store from a JSON-compatible corpus. """
+        store = cls()
+        for poem in corpus:
+            store.add_poem(poem)
+        return store
+
+    def __len__(self):
+        return self.count["poem"]
+
+    def record(self, level, a, children):
+        """ Rebuilds the JSON-compatible dictionary of a record;
+        children holds the rebuilt lists of its children by key. """
+        record = dict()
+        other = self.other[level][a]
+        for key in self.shapes[self.shape[level][a]]:
+            if(other is not None and key in other):
+                record[key] = other[key]
+            elif(key in children):
+                record[key] = children[key]
+            elif(key in self.string_columns[level]):
+                record[key] = self.strings[self.columns[level][key][a]]
+            else:
+                record[key] = self.columns[level][key][a]
+        return record
+
+    def stanzas_json(self, first, last):
+        stanzas = []
+        for s in range(first, last):
+            lines = []
+            for l in range(self.stanza_lines[0][s], self.stanza_lines[1][s]):
+                words = [self.record("word", w, {}) for w in range(self.line_words[0][l], self.line_words[1][l])]
+                lines.append(self.record("line", l, { "words": words }))
+            stanzas.append(self.record("stanza", s, { "lines": lines }))
+        return stanzas
+
+    def poem(self, a):
+        """ Rebuilds the JSON-compatible poem at position a. """
+        parts = []
+        for b in range(self.poem_parts[0][a], self.poem_parts[1][a]):
+            parts.append(self.record("part", b, { "stanzas": self.stanzas_json(self.part_stanzas[0][b], self.part_stanzas[1][b]) }))
+        # The stanzas of the poem itself come after the stanzas of its parts.
+        first = self.poem_stanzas[0][a]
+        if(len(parts) > 0):
+            first = self.part_stanzas[1][self.poem_parts[1][a] - 1]
+        return self.record("poem", a, { "parts": parts, "stanzas": self.stanzas_json(first, self.poem_stanzas[1][a]) })
+
+    def to_corpus(self):
+        """ Rebuilds the JSON-compatible corpus. """
+        return [self.poem(a) for a in range(len(self))]
+
+    def line_range(self, a=None):
+        """ Returns the range of the lines of the poem at position a,
+        or of the whole corpus. """
+        if(a is None):
+            return range(self.count["line"])
+        first = self.poem_stanzas[0][a]
+        last = self.poem_stanzas[1][a]
+        if(first == last):
+            return range(0)
+        return range(self.stanza_lines[0][first], self.stanza_lines[1][last - 1])
+
+    def word_range(self, a=None):
+        """ Returns the range of the words of the poem at position a,
+        or of the whole corpus. """
+        if(a is None):
+            return range(self.count["word"])
+        lines = self.line_range(a)
+        if(len(lines) == 0):
+            return range(0)
+        return range(self.line_words[0][lines.start], self.line_words[1][lines.stop - 1])
+
+    def number_of_words(self, a=None):
+        """ Returns the number of words (with a text) of the poem at position a,
+        or of the whole corpus. """
+        words = self.word_range(a)
+        return len(words) - self.columns["word"]["word_text"][words.start:words.stop].count(-1)
+
+    def lemma_frequencies(self, a=None):
+        """ Returns the frequency of every lemma of the poem at position a,
+        or of the whole corpus, counted over the lemma column with NumPy
+        (if it is installed). """
+        words = self.word_range(a)
+        try:
+            import numpy
+        except ImportError:
+            frequencies = dict()
+            for lemma in self.columns["word"]["lemma"][words.start:words.stop]:
+                if(lemma != -1):
+                    frequencies[lemma] = frequencies.get(lemma, 0) + 1
+            return { self.strings[lemma]: frequencies[lemma] for lemma in frequencies }
+        lemmas = self.numpy("word", "lemma")[words.start:words.stop]
+        frequencies = numpy.bincount(lemmas[lemmas != -1])
+        return { self.strings[lemma]: int(frequencies[lemma]) for lemma in numpy.flatnonzero(frequencies).tolist() }
+
+    def syllable_statistics(self, a=None):
+        """ Returns the long and the stressed syllable statistics
+        (see SyllableAnalyzer) of the poem at position a, or of the whole
+        corpus, computed from the metric and stress patterns of the lines.
+        With NumPy (if it is installed) the patterns are joined into one
+        array of marks, every mark numbered by its line length and its
+        position, and the marks are counted by these numbers at once. """
+        try:
+            import numpy
+        except ImportError:
+            return self.syllable_statistics_loop(a)
+        lines = self.line_range(a)
+        counts = self.numpy("line", "syllable_count")[lines.start:lines.stop]
+        metric = self.numpy("line", "metric_pattern")[lines.start:lines.stop]
+        stress = self.numpy("line", "stress_pattern")[lines.start:lines.stop]
+        valid = (counts != -1) & (metric != -1) & (stress != -1)
+        counts = counts[valid]
+        if(len(counts) == 0):
+            return [dict(), dict()]
+        lengths, first = numpy.unique(counts, return_index=True)
+        lengths = lengths[numpy.argsort(first)].tolist() # In the order of the lines, like SyllableAnalyzer.
+        top = int(counts.max())
+        positions = numpy.arange(int(counts.sum())) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+        cells = numpy.repeat(counts, counts) * top + positions # One number for each line length and position.
+        statistics = []
+        for column, mark in [[metric[valid], '-'], [stress[valid], '|']]:
+            marks = ''.join([self.strings[pattern][:count].ljust(count) for pattern, count in zip(column.tolist(), counts.tolist())])
+            found = numpy.frombuffer(marks.encode('ascii', 'replace'), dtype=numpy.uint8) == ord(mark)
+            histogram = numpy.bincount(cells[found], minlength=(top + 1) * top)
+            statistics.append({ length: histogram[length * top:length * top + length].tolist() for length in lengths })
+        return statistics
+
+    def syllable_statistics_loop(self, a=None):
+        """ syllable_statistics() without NumPy, line by line. """
+        counts = self.columns["line"]["syllable_count"]
+        metric = self.columns["line"]["metric_pattern"]
+        stress = self.columns["line"]["stress_pattern"]
+        syllstat = dict()
+        stressstat = dict()
+        for l in self.line_range(a):
+            syllline = counts[l]
+            if(metric[l] == -1 or stress[l] == -1 or syllline == -1):
+                continue
+            if(syllline not in syllstat):
+                syllstat[syllline] = array('l', [0]) * syllline
+                stressstat[syllline] = array('l', [0]) * syllline
+            spatt = self.strings[metric[l]]
+            stresspatt = self.strings[stress[l]]
+            for b in range(syllline):
+                if(spatt[b] == '-'):
+                    syllstat[syllline][b] += 1
+                if(stresspatt[b] == '|'):
+                    stressstat[syllline][b] += 1
+        return [{ key: list(syllstat[key]) for key in syllstat },
+                { key: list(stressstat[key]) for key in stressstat }]
+
+    def numpy(self, level, key):
+        """ Returns a column as a NumPy array, for vectorized statistics
+        (see lemma_frequencies() and syllable_statistics()). NumPy is only
+        needed for these, which count without it more slowly. """
+        import numpy
+        column = self.columns[level][key]
+        return numpy.frombuffer(column, dtype='i' + str(column.itemsize))
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the stages of ANAC on a synthetic corpus.
+The external tools (eSpeak, hfst-lookup and the PurePos JVM) are replaced by
+small deterministic stub executables, and the PDC system by a local stand-in
+repository, so the benchmark runs anywhere and measures the code of ANAC.
+The numbers of different versions can be compared with --output and --compare.
+
+The import stage times a fresh import of anac (the best of 5), and name_trie
+the proper name matching of the normalizer against 5000 names (with the
+linear scan it replaced as name_scan).
+
+Usage: python3 benchmark.py [--poems 500] [--seed 1] [--stages poemtextjson,convert]
+                            [--output results.json] [--compare old.json] [--keep]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+stages = ["import", "poemtextjson", "name_trie", "analyze_syll", "analyze_morph", "convert", "analyze_corpus",
+          "linesearch", "store_corpus", "download_corpus", "pdcdata"]
+
+""" Old Hungarian-like words (with the old spellings) and punctuation. """
+vocabulary = ["czillag", "wilag", "keserwes", "lelkem", "Isten", "vala", "mykoron", "ees", "wr", "kyral",
+              "zent", "zerelmes", "aniam", "fiam", "halal", "eletnek", "meg-hala", "el-iara", "haza",
+              "uilagbele", "tekunched", "siralmal", "gyermekem", "Mária", "Péter", "Arany", "Budán",
+              "igen", "nagy", "szép", "ó", "kérlek", "ſok", "dzsida", "hazak", "népek", "ének", "vitéz"]
+punctuation = ["", "", "", ",", ".", "!", "?", ";", ":"]
+syllables = ["Ba", "la", "zs", "Pé", "ter", "Mi", "hály", "Er", "zsé", "bet", "Ka", "ta", "lin", "Jó", "zsef",
+             "Szé", "kely", "fa", "lu", "vár", "hegy", "Bu", "da", "Eger", "gyö", "rgy", "An", "na", "ős", "ke"]
+
+espeak_stub = '''
+import sys
+def transcribe(word):
+    word = word.strip()
+    if(len(word) == 0):
+        return ''
+    if(word.isdigit()):
+        return ' ˈɛɟmilioː\\n'
+    return ' ' + word.lower().replace('sz', 's').replace('cs', 'tʃ').replace('w', 'v') + '\\n'
+if('--version' in sys.argv):
+    print('eSpeak stub 1.0')
+    sys.exit()
+args = sys.argv[1:]
+words = [args[a] for a in range(len(args)) if not args[a].startswith('-') and (a == 0 or args[a - 1] != '-v')]
+if(len(words) > 0):
+    sys.stdout.write(transcribe(words[0]))
+else:
+    for line in sys.stdin:
+        sys.stdout.write(transcribe(line))
+        sys.stdout.flush()
+'''
+
+hfst_stub = '''
+import sys
+for line in sys.stdin:
+    word = line.rstrip('\\n')
+    if(word in ['[EOL]', '[EOS]'] or word.startswith('[ANAC') or len(word) == 0 or word.endswith('q')):
+        out = word + '\\t' + word + '+?\\tinf\\n'
+    else:
+        out = word + '\\t' + word + '[N][Nom]\\t0,000000\\n'
+        out += word + '\\t' + word[:2] + '[_Der]' + word[2:] + '[N]\\t0,000000\\n'
+        if('el' in word):
+            out += word + '\\tel[VPfx]' + word + '[V][Prs.Def.3Sg]\\t0,000000\\n'
+        if(word.endswith('k')):
+            out += word + '\\t' + word[:-1] + '[N][Pl]\\t0,000000\\n'
+    sys.stdout.write(out + '\\n')
+    sys.stdout.flush()
+'''
+
+java_stub = '''
+import sys
+args = sys.argv[1:]
+source = sys.stdin
+if('-i' in args):
+    source = open(args[args.index('-i') + 1])
+def tag(token):
+    if('{{' not in token):
+        return token + '#' + token + '#[?]'
+    form, rest = token.split('{{', 1)
+    lemma, tags = rest[:-2].split('||')[-1].split('[', 1)
+    return form + '#' + lemma + '#[' + tags
+for line in source:
+    line = line.rstrip('\\n')
+    if(len(line) > 0):
+        sys.stdout.write(' '.join([tag(token) for token in line.split(' ')]))
+    sys.stdout.write('\\n')
+    sys.stdout.flush()
+'''
+
+elonorm_stub = '''
+import re
+def memory_dict_from_file(location):
+    memdict = dict()
+    for line in open(location):
+        if('\\t' in line):
+            word, norm = line.split('\\t', 1)
+            memdict[word] = norm
+    return memdict
+def char_rules_from_file(location):
+    rules = dict()
+    for line in open(location):
+        if('\\t' in line):
+            old, new = line.rstrip('\\n').split('\\t')
+            rules[old] = new
+    return rules
+def regex_sub(text, rules):
+    for old in rules:
+        text = re.sub(old, rules[old], text)
+    return text
+'''
+
+
+class StubRepository:
+    """ A local stand-in for the PDC repository with the same searchm() and show(). """
+
+    def __init__(self, texts):
+        self.ids = dict()
+        self.records = dict()
+        for a in range(len(texts)):
+            poemid = 'RPHA%05d' % a
+            self.ids[poemid] = a
+            self.records[a] = { "poemid": [poemid], "otkatxt": [texts[a]], "author": ['Anonymus'],
+                               "title": ['Ének ' + str(a)], "syllables": ['8'],
+                               "date": [json.dumps({ "date": str(1500 + a % 100) })], "incipit": [texts[a][:30]],
+                               "sourcecat": ['RMNy ' + str(a)], "genre": ['história'],
+                               "metre": [json.dumps({ "metre": '8/8' })], "acrostic": [json.dumps({ "acrostic": '' })],
+                               "colophon": [json.dumps({ "colophon": '' })], "place": [''] }
+
+    def searchm(self, field, values):
+        return [self.ids[value] for value in values if value in self.ids]
+
+    def show(self, fields, ids):
+        return [[a] + [self.records[a][field] for field in fields] for a in ids]
+
+
+def make_texts(poems, seed=1):
+    """ Generates plain text poems: stanzas of lines, some of them divided
+    into parts, some with [miss ... lines] markers. """
+    generator = random.Random(seed)
+    texts = []
+    for a in range(poems):
+        stanzas = []
+        for b in range(generator.randint(3, 12)):
+            lines = []
+            for c in range(generator.randint(2, 6)):
+                words = [generator.choice(vocabulary) for d in range(generator.randint(3, 8))]
+                lines.append(' '.join(words) + generator.choice(punctuation))
+            if(generator.random() < 0.05):
+                lines.insert(generator.randint(0, len(lines)), '[miss "' + str(generator.randint(1, 4)) + ' lines"]')
+            stanzas.append('\n'.join(lines))
+        text = '\n\n'.join(stanzas)
+        if(generator.random() < 0.2):
+            middle = len(stanzas) // 2
+            text = ('[part "Első rész"]\n' + '\n\n'.join(stanzas[:middle]) +
+                    '\n[part "Második rész"]\n' + '\n\n'.join(stanzas[middle:]))
+        texts.append(text)
+    return texts
+
+
+def make_names(count, seed=1):
+    """ Generates a list of proper names of one to four syllables. """
+    generator = random.Random(seed)
+    names = set(["Mária", "Péter", "Arany", "Budán"])
+    while(len(names) < count):
+        name = ''.join([generator.choice(syllables) for a in range(generator.randint(1, 4))])
+        names.add(name[0].upper() + name[1:])
+    return sorted(names)
+
+
+def write_file(location, content, executable=False):
+    folder = os.path.dirname(location)
+    if(len(folder) > 0 and not os.path.exists(folder)):
+        os.makedirs(folder)
+    file = open(location, "w")
+    file.write(content)
+    file.close()
+    if(executable):
+        os.chmod(location, 0o755)
+
+
+def prepare(workdir):
+    """ Writes the stub tools and the resources into the working directory,
+    puts the stubs on the PATH and changes into the directory. """
+    for name, stub in [["espeak", espeak_stub], ["hfst-lookup", hfst_stub], ["java", java_stub]]:
+        write_file(os.path.join(workdir, "bin", name), '#!' + sys.executable + '\n' + stub, True)
+    os.environ["PATH"] = os.path.join(workdir, "bin") + os.pathsep + os.environ["PATH"]
+    try:
+        import elonorm
+    except ImportError:
+        write_file(os.path.join(workdir, "modules", "elonorm.py"), elonorm_stub)
+        sys.path.insert(0, os.path.join(workdir, "modules"))
+    write_file(os.path.join(workdir, "elonorm", "historias_szotar.csv"), "vala\tvolt\nwr\túr\nees\tés\nMária\tMária\nPéter\tPéter\nArany\tArany\n")
+    write_file(os.path.join(workdir, "elonorm", "historias_char_subs.csv"), "cz\tc\nw\tv\ny\ti\n")
+    write_file(os.path.join(workdir, "elonorm", "proper_names.csv"), "Mária\nPéter\nArany\n")
+    write_file(os.path.join(workdir, "emMorphOMH_distrib", "hfst", "OMH.hfstol"), "stub transducer\n")
+    write_file(os.path.join(workdir, "purepos", "purepos-2.1.one-jar.jar"), "stub\n")
+    write_file(os.path.join(workdir, "purepos", "omh.model"), "stub\n")
+    os.chdir(workdir)
+
+
+def record(results, stage, seconds, count, unit):
+    """ Records the time and the throughput of a stage. """
+    results[stage] = { "seconds": seconds, "count": count, "unit": unit,
+                       "throughput": count / seconds if seconds > 0 else 0 }
+    print("%-16s %9.3f s %10d %-8s %12.1f %s/s" % (stage, seconds, count, unit, results[stage]["throughput"], unit))
+
+
+def measure(results, stage, function, count, unit):
+    """ Runs a stage and records its time and throughput. """
+    start = time.perf_counter()
+    function()
+    record(results, stage, time.perf_counter() - start, count, unit)
+
+
+def import_time(repeat=5):
+    """ Imports anac in fresh interpreters and returns the import times
+    (the best of them) and whether the PDC and elonorm modules were loaded. """
+    here = os.path.dirname(os.path.abspath(__file__))
+    script = ("import sys, time; start = time.perf_counter(); import anac; "
+              "print(time.perf_counter() - start, 'pdc' in sys.modules, 'elonorm' in sys.modules)")
+    times = []
+    for a in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=here, env=dict(os.environ, PYTHONPATH=here))
+        seconds, pdc, elonorm = output.decode('utf-8').split()
+        times.append(float(seconds))
+    return min(times), pdc == 'True', elonorm == 'True'
+
+
+def run(poems, seed, selected, keep):
+    workdir = tempfile.mkdtemp(prefix="anac-benchmark-")
+    here = os.getcwd()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    prepare(workdir)
+    import anac
+    results = dict()
+    try:
+        if("import" in selected):
+            seconds, pdc, elonorm = import_time()
+            record(results, "import", seconds, 1, "imports")
+            print("%-16s PDC imported: %s, elonorm imported: %s" % ('', pdc, elonorm))
+        texts = make_texts(poems, seed)
+        characters = sum([len(text) for text in texts])
+        corpus = []
+
+        def tokenize():
+            corpus[:] = [anac.poemjson(texts[a], 'RPHA%05d' % a, 'Anonymus', 'Ének ' + str(a)) for a in range(len(texts))]
+        measure(results, "poemtextjson", tokenize, characters, "chars")
+        units = [unit for poem in corpus for unit in anac.poem_units(poem)]
+        words = sum([len(line.get("words", [])) for unit in units for stanza in unit["stanzas"] for line in stanza["lines"]])
+        quiet = open(os.devnull, "w")
+        stdout = sys.stdout
+
+        if("name_trie" in selected):
+            names = make_names(5000, seed)
+            wordtexts = [word["word_text"] for unit in units for stanza in unit["stanzas"] for line in stanza["lines"] for word in line.get("words", [])]
+            trie = anac.NameTrie(names)
+            measure(results, "name_trie", lambda: [trie.matches(word) for word in wordtexts], len(wordtexts), "words")
+            sample = wordtexts[:2000] # The linear scan of the names before the trie.
+            measure(results, "name_scan", lambda: [len([name for name in names if word.startswith(name)]) for word in sample], len(sample), "words")
+
+        if("analyze_syll" in selected):
+            poems_syll = json.loads(json.dumps(corpus))
+            measure(results, "analyze_syll", lambda: [anac.analyze_poem(poem, [anac.SyllableAnalyzer()]) for poem in poems_syll], words, "words")
+
+        if("analyze_morph" in selected):
+            poems_morph = json.loads(json.dumps(corpus))
+
+            def morph():
+                sys.stdout = quiet
+                hfst = anac.MorphCache(anac.HfstSession())
+                purepos = anac.PurePosSession()
+                try:
+                    for poem in poems_morph:
+                        for unit in anac.poem_units(poem):
+                            anac.analyze_morph(unit, anac.poem_normalizator(poem), hfst, purepos, anac.AnalysisContext())
+                finally:
+                    hfst.close()
+                    purepos.close()
+                    sys.stdout = stdout
+            measure(results, "analyze_morph", morph, words, "words")
+
+        if("convert" in selected):
+            hfst = anac.HfstSession()
+            wordlist = [word["word_text"] for unit in units for stanza in unit["stanzas"] for line in stanza["lines"] for word in line.get("words", [])]
+            morph = anac.filter_derivations(hfst.lookup(wordlist))
+            hfst.close()
+            measure(results, "convert", lambda: anac.convert(morph, context=anac.AnalysisContext()), len(morph), "chars")
+
+        if("analyze_corpus" in selected):
+            poems_all = json.loads(json.dumps(corpus))
+
+            def analyze():
+                sys.stdout = quiet
+                try:
+                    anac.analyze_corpus(["morphology", "syllables", "length", "phonetic", "wordstat"], poems_all,
+                                        ipacache=None, morphcache=None, context=anac.AnalysisContext())
+                finally:
+                    sys.stdout = stdout
+            measure(results, "analyze_corpus", analyze, words, "words")
+
+        if("linesearch" in selected):
+            patterns = ["czillag", "wilag|világ", "^Isten", "(?i)kyral", "k.r", "el-[a-z]+a", "szép vitéz", "[!?]$"]
+            measure(results, "linesearch", lambda: [anac.linesearch(pattern, corpus, False) for pattern in patterns], len(patterns), "queries")
+            index = anac.LineIndex(corpus)
+            measure(results, "linesearch_index", lambda: [index.search(pattern) for pattern in patterns], len(patterns), "queries")
+
+        if("store_corpus" in selected):
+            measure(results, "store_corpus", lambda: anac.store_corpus(os.path.join(workdir, "stored"), corpus), len(corpus), "poems")
+
+        repository = StubRepository(texts)
+        if("download_corpus" in selected):
+
+            def download():
+                sys.stdout = quiet
+                try:
+                    anac.download_corpus(repository, repository.searchm('poemid', list(repository.ids)), 100, 2)
+                finally:
+                    sys.stdout = stdout
+            measure(results, "download_corpus", download, len(texts), "poems")
+
+        if("pdcdata" in selected):
+            poems_pdc = [{ "poem_id": 'RPHA%05d' % a } for a in range(len(texts))]
+
+            def metadata():
+                sys.stdout = quiet
+                try:
+                    anac.pdcdata(["date", "incipit", "sources", "genre", "metre", "acrostic", "colophon", "place"], poems_pdc, repository)
+                finally:
+                    sys.stdout = stdout
+            measure(results, "pdcdata", metadata, len(poems_pdc), "poems")
+        quiet.close()
+    finally:
+        os.chdir(here)
+        if(keep):
+            print("Working directory: " + workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def compare(results, location):
+    """ Prints the speedup of every stage against earlier results. """
+    file = open(location, "r")
+    earlier = json.loads(file.read())["stages"]
+    file.close()
+    for stage in results:
+        if(stage in earlier and earlier[stage]["throughput"] > 0):
+            print("%-16s %6.2fx" % (stage, results[stage]["throughput"] / earlier[stage]["throughput"]))
+
+
+if(__name__ == '__main__'):
+    parser = argparse.ArgumentParser(description="Benchmark of the stages of ANAC on a synthetic corpus.")
+    parser.add_argument("--poems", type=int, default=500, help="number of poems in the synthetic corpus")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the synthetic corpus")
+    parser.add_argument("--stages", default=','.join(stages), help="comma-separated stages to run")
+    parser.add_argument("--output", help="JSON file to write the results into")
+    parser.add_argument("--compare", help="JSON file of earlier results to compare with")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory")
+    options = parser.parse_args()
+    results = run(options.poems, options.seed, options.stages.split(','), options.keep)
+    if(options.output is not None):
+        file = open(options.output, "w")
+        file.write(json.dumps({ "poems": options.poems, "seed": options.seed, "python": platform.python_version(),
+                               "time": time.strftime("%Y-%m-%d %H:%M:%S"), "stages": results }, indent=2))
+        file.close()
+    if(options.compare is not None):
+        compare(results, options.compare)
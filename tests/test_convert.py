@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+""" convert() (and mconv()) must give the output of the original conversion.
+The golden file holds hfst-lookup outputs with the output and the positions
+of the unanalyzed words of convert() before it was rewritten. """
+
+import json
+import os
+
+import anac
+
+golden = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "convert.json")
+
+
+def cases():
+    file = open(golden, "r", encoding='utf-8')
+    loaded = json.loads(file.read())
+    file.close()
+    return loaded
+
+
+def test_convert_golden():
+    for case in cases():
+        context = anac.AnalysisContext()
+        assert anac.convert(case["input"], context=context) == case["output"]
+        assert context.unanalyzed_pos == case["unanalyzed_pos"]
+
+
+def test_convert_cached():
+    converted = dict()
+    for case in cases():
+        assert anac.convert(case["input"], converted, anac.AnalysisContext()) == case["output"]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+""" The LineIndex has to find the same lines as the plain scan of linesearch(). """
+
+import random
+
+import anac
+
+words = ["kírály", "kırály", "KİRÁLY", "Király", "szent", "ſzent", "SZENT", "Isten", "ıſten", "straße", "STRASSE",
+         "vitéz", "el-jöve", "ó", "jő", "a", "az", "és"]
+patterns = ["(?i)kir", "(?i)KIR", "kir", "kır", "(?i)király", "(?i)szent", "(?i)ſzent", "(?i)isten", "(?i)ıſten",
+            "(?i)straße", "(?i)strasse", "(?i)STRASSE", "el-jö", "(?i)(kir|szent)", "(?i)is.en", "^a ", "jő$",
+            "(?i)k[ií]r", "vit(éz|ez)", "(?i)(?:az){1,2} ", "(?i)i"]
+
+
+def corpus(poems, seed):
+    generator = random.Random(seed)
+    return [{ "poem_id": 'RPHA' + str(a),
+             "stanzas": [{ "lines": [{ "line_text": ' '.join(generator.choice(words) for c in range(generator.randint(1, 6))) }
+                                     for b in range(generator.randint(1, 5))] }] }
+            for a in range(poems)]
+
+
+def test_index_equals_scan():
+    texts = corpus(200, 1)
+    index = anac.LineIndex(texts)
+    for pattern in patterns:
+        assert index.search(pattern) == anac.linesearch(pattern, texts, False), pattern
+
+
+def test_dotless_i():
+    texts = [{ "poem_id": 'RPHA1', "stanzas": [{ "lines": [{ "line_text": "a kırály jő" }, { "line_text": "KİRÁLY" }] }] }]
+    for pattern in ["(?i)kir", "(?i)KIR"]:
+        assert anac.LineIndex(texts).search(pattern)["hits"] == anac.linesearch(pattern, texts, False)["hits"] == 2
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+""" poemjson() must build the JSON structure of the original tokenizer.
+The golden file holds random and poem-like texts (with parts and missing
+line markers) with the poems, or the exceptions, of poemjson() before
+the tokenizer was rewritten. """
+
+import json
+import os
+
+import pytest
+
+import anac
+
+golden = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "poemjson.json")
+
+
+def cases():
+    file = open(golden, "r", encoding='utf-8')
+    loaded = json.loads(file.read())
+    file.close()
+    return loaded
+
+
+def test_poemjson_golden():
+    for case in cases():
+        if("error" in case):
+            with pytest.raises(Exception) as raised:
+                anac.poemjson(case["text"], 'RPHA1', 'Anonymus', 'Cím')
+            assert type(raised.value).__name__ == case["error"]
+        else:
+            poem = anac.poemjson(case["text"], 'RPHA1', 'Anonymus', 'Cím')
+            assert json.dumps(poem, ensure_ascii=False) == json.dumps(case["poem"], ensure_ascii=False)